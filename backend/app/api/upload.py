@@ -4,14 +4,21 @@ It follows the flow:
 1. Receives files from a user via a POST request.
 2. Verifies the user's JWT for authentication.
 3. Validates that the files are of an allowed type (.csv, .xlsx).
-4. Uploads each valid file to a MinIO object storage bucket.
-5. Creates a '_complete' marker file in MinIO to signal the batch is finished.
-6. Creates a local trigger file that a watchdog service monitors.
-7. The watchdog service then initiates the data processing pipeline.
+4. Responds 202 Accepted with an upload id; the remaining steps run as a
+   background task and can be polled via GET /upload/status/{upload_id}.
+5. Uploads each valid file to a MinIO object storage bucket.
+6. Creates a '_complete' marker file in MinIO to signal the batch is finished.
+7. Creates a local trigger file that a watchdog service monitors.
+8. The watchdog service then initiates the data processing pipeline.
 """
 import os
+import re
+import uuid
+import asyncio
 import logging
-from fastapi import APIRouter, UploadFile, File, Depends, HTTPException, status
+from collections import OrderedDict
+from fastapi import APIRouter, BackgroundTasks, UploadFile, File, Depends, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
 from typing import List
 
 # from app.services.auth import get_current_user
@@ -25,6 +32,19 @@ router = APIRouter()
 logging.basicConfig(level=logging.INFO)
 log = logging.getLogger(__name__)
 
+# Upper bound on simultaneous MinIO PUTs issued by a single request.
+MAX_CONCURRENT_UPLOADS = 8
+
+# Filename pattern -> MinIO folder. First match wins; add new file types here.
+FILENAME_ROUTES = [
+    (re.compile(r"Sales Transaction List"), settings.minio_raw_sales_folder),
+    (re.compile(r"Sales Report by Product"), settings.minio_raw_sales_by_product_folder),
+]
+
+# In-memory status of recent uploads, keyed by upload id (oldest evicted first).
+MAX_TRACKED_UPLOADS = 256
+upload_status = OrderedDict()
+
 
 # --- Helper function for file validation ---
 def validate_file_type(filename: str) -> bool:
@@ -37,20 +57,42 @@ def validate_file_type(filename: str) -> bool:
     return ext.lower() in ALLOWED_EXTENSIONS
 
 
-@router.post("/")
-async def handle_file_upload(
-    files: List[UploadFile] = File(...),
-    # The 'Depends' on get_current_user handles JWT validation.
-    # If the token is invalid, it will raise a 401 Unauthorized error automatically.
-    ##current_user: dict = Depends(get_current_user),
-):
+def _write_trigger_file() -> str:
     """
-    Handles the main file upload flow. It authenticates the user, validates
-    files, uploads them to MinIO, and triggers the processing pipeline.
+    Creates the local trigger file watched by the observer service.
+    The observer runs in its own container and shares only the trigger
+    volume with the API, so the handoff has to stay on the filesystem.
     """
-    ##log.info(f"Upload request received from user: {current_user.get('email')}")
+    # The trigger directory is created once at startup (see app.main).
+    trigger_file_path = os.path.join(settings.trigger_dir, "complete")
+    
+    # Only the file's existence matters to the observer, so no fsync:
+    # the create event fires as soon as the file is opened.
+    with open(trigger_file_path, "w") as f:
+        f.write("trigger")
+    return trigger_file_path
+
 
-    uploaded_files_details = []
+async def _bounded_upload(sem: asyncio.Semaphore, file: UploadFile, target_folder: str) -> int:
+    """Uploads a single file to MinIO while holding a slot of the semaphore."""
+    async with sem:
+        return await upload_file_to_minio(file, file.filename, target_folder)
+
+
+def _set_upload_status(upload_id: str, state: str, **details) -> None:
+    """Records the state of an upload, evicting the oldest entries past the cap."""
+    upload_status[upload_id] = {"upload_id": upload_id, "status": state, **details}
+    upload_status.move_to_end(upload_id)
+    while len(upload_status) > MAX_TRACKED_UPLOADS:
+        upload_status.popitem(last=False)
+
+
+def _validate_and_route(files: List[UploadFile]) -> list:
+    """
+    Validates file types and resolves each file's MinIO folder.
+    Returns (file, target_folder) pairs for the files that will be uploaded.
+    """
+    accepted_files = []
 
     for file in files:
         # --- 1. Validates file types ---
@@ -59,39 +101,43 @@ async def handle_file_upload(
             continue  # Skip this file and move to the next
 
         # --- 2. Determine target folder based on filename ---
-        target_folder: str | None = None
-        if "Sales Transaction List" in file.filename:
-            target_folder = settings.minio_raw_sales_folder
-        elif "Sales Report by Product" in file.filename:
-            target_folder = settings.minio_raw_sales_by_product_folder
+        target_folder: str | None = next(
+            (folder for pattern, folder in FILENAME_ROUTES if pattern.search(file.filename)),
+            None,
+        )
 
         if not target_folder:
             log.warning(f"Unrecognized file name pattern, skipping: {file.filename}")
             continue
 
-        try:
-            # --- 3. Uploads files to MinIO into the correct folder ---
-            file_size = await upload_file_to_minio(
-                file, file.filename, target_folder
-            )
-            uploaded_files_details.append(
-                {"filename": file.filename, "folder": target_folder}
-            )
-            log.info(
-                f"Successfully uploaded {file.filename} ({file_size} bytes) to MinIO folder '{target_folder}'."
-            )
-
-        except Exception as e:
-            log.error(f"Failed to upload {file.filename}: {e}")
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail=f"Failed to upload file: {file.filename}",
-            )
-
-    if not uploaded_files_details:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="No valid files were uploaded. Check file names and types (.csv, .xlsx).",
+        accepted_files.append((file, target_folder))
+
+    return accepted_files
+
+
+async def _persist_to_minio_and_trigger(upload_id: str, accepted_files: list) -> None:
+    """
+    Background part of an upload: pushes the files to MinIO, writes the
+    '_complete' marker and the local trigger file, and records the outcome.
+    FastAPI keeps the request's UploadFiles open until background tasks finish.
+    """
+    _set_upload_status(upload_id, "uploading")
+
+    # --- 3. Uploads files to MinIO concurrently, into the correct folders ---
+    sem = asyncio.Semaphore(MAX_CONCURRENT_UPLOADS)
+    tasks = [
+        asyncio.create_task(_bounded_upload(sem, file, target_folder))
+        for file, target_folder in accepted_files
+    ]
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+
+    for (file, target_folder), result in zip(accepted_files, results):
+        if isinstance(result, Exception):
+            log.error(f"Failed to upload {file.filename}: {result}")
+            _set_upload_status(upload_id, "failed", detail=f"Failed to upload file: {file.filename}")
+            return
+        log.info(
+            f"Successfully uploaded {file.filename} ({result} bytes) to MinIO folder '{target_folder}'."
         )
 
     try:
@@ -100,28 +146,66 @@ async def handle_file_upload(
         log.info("Created '_complete' marker in MinIO.")
 
         # --- 5. Triggers pipeline by creating the local trigger file ---
-        # Ensure the trigger directory exists before writing to it
-        os.makedirs(settings.trigger_dir, exist_ok=True)
-        trigger_file_path = os.path.join(settings.trigger_dir, "complete")
-        
-        # Write and explicitly flush to ensure file is created before observer checks
-        with open(trigger_file_path, "w") as f:
-            f.write("trigger")
-            f.flush()
-            os.fsync(f.fileno())  # Force write to disk
+        # Blocking file I/O runs in the threadpool, off the event loop.
+        trigger_file_path = await run_in_threadpool(_write_trigger_file)
         
         log.info(f"Created local trigger file at: {trigger_file_path}")
 
     except Exception as e:
         log.error(f"Failed during trigger or marker creation: {e}")
         # Note: You might want to add logic here to clean up the files if this part fails
+        _set_upload_status(upload_id, "failed", detail="Files uploaded but failed to trigger pipeline.")
+        return
+
+    _set_upload_status(upload_id, "triggered")
+
+
+@router.post("/", status_code=status.HTTP_202_ACCEPTED)
+async def handle_file_upload(
+    background_tasks: BackgroundTasks,
+    files: List[UploadFile] = File(...),
+    # The 'Depends' on get_current_user handles JWT validation.
+    # If the token is invalid, it will raise a 401 Unauthorized error automatically.
+    ##current_user: dict = Depends(get_current_user),
+):
+    """
+    Handles the main file upload flow. It authenticates the user, validates
+    files, and queues the MinIO upload and pipeline trigger as a background
+    task, returning 202 as soon as the request body has been received.
+    """
+    ##log.info(f"Upload request received from user: {current_user.get('email')}")
+
+    accepted_files = _validate_and_route(files)
+
+    if not accepted_files:
         raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="Files uploaded but failed to trigger pipeline.",
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="No valid files were uploaded. Check file names and types (.csv, .xlsx).",
         )
 
-    # --- 6. Returns success response ---
+    upload_id = uuid.uuid4().hex
+    _set_upload_status(upload_id, "accepted")
+    background_tasks.add_task(_persist_to_minio_and_trigger, upload_id, accepted_files)
+
+    # --- 6. Returns accepted response ---
     return {
-        "message": "Files uploaded successfully and pipeline triggered.",
-        "uploaded_files": uploaded_files_details,
-    }
\ No newline at end of file
+        "upload_id": upload_id,
+        "status": "accepted",
+        "message": "Files received; upload to storage and pipeline trigger are in progress.",
+        "uploaded_files": [
+            {"filename": file.filename, "folder": target_folder}
+            for file, target_folder in accepted_files
+        ],
+    }
+
+
+@router.get("/status/{upload_id}")
+async def get_upload_status(upload_id: str):
+    """Returns the state of a previous upload: accepted, uploading, triggered or failed."""
+    state = upload_status.get(upload_id)
+    if state is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Unknown upload id: {upload_id}",
+        )
+    return state
@@ -7,6 +7,7 @@ where Docker Compose injects the necessary variables at runtime.
 """
 
 import os
+import pathlib
 from typing import List
 from urllib.parse import quote_plus
 from dotenv import load_dotenv
@@ -21,6 +22,11 @@ def _str_to_bool(v: str | None, default: bool = False) -> bool:
         return default
     return v.strip().lower() in ("1", "true", "yes", "on")
 
+# Pipeline trigger default: backend/trigger for local dev, /app/trigger for Docker.
+# Resolved once at import rather than inside the Settings class body.
+_BACKEND_DIR = pathlib.Path(__file__).parents[2]  # Navigate to backend/
+_DEFAULT_TRIGGER_DIR = "/app/trigger" if os.path.exists("/app") else str(_BACKEND_DIR / "trigger")
+
 class Settings:
     # API
     api_host: str = os.getenv("API_HOST", "0.0.0.0")
@@ -59,14 +65,13 @@ class Settings:
     minio_raw_sales_by_product_folder: str = os.getenv("MINIO_RAW_SALES_BY_PRODUCT_FOLDER", "raw_sales_by_product")
     minio_staging_bucket: str = os.getenv("MINIO_STAGING_BUCKET", "staging")
     minio_etl_folder: str = os.getenv("MINIO_ETL_FOLDER", "etl")
+    minio_parallel_uploads: int = int(os.getenv("MINIO_PARALLEL_UPLOADS", "4"))
     
     # Pipeline Trigger
-    # Use backend/trigger for local dev, /app/trigger for Docker
-    import pathlib
-    _backend_dir = pathlib.Path(__file__).parent.parent.parent  # Navigate to backend/
-    _default_trigger = str(_backend_dir / "trigger") if not os.path.exists("/app") else "/app/trigger"
-    _trigger_dir_raw: str = os.getenv("TRIGGER_DIR", _default_trigger)
+    _trigger_dir_raw: str = os.getenv("TRIGGER_DIR", _DEFAULT_TRIGGER_DIR)
     trigger_dir: str = os.path.normpath(os.path.abspath(_trigger_dir_raw))  # Normalize and make absolute
+    # Window in which repeated 'complete' triggers are coalesced into one pipeline run
+    trigger_coalesce_ms: int = int(os.getenv("TRIGGER_COALESCE_MS", "200"))
 
     # Authentication (Keycloak)
     keycloak_issuer: str = os.getenv("KEYCLOAK_ISSUER", "http://keycloak:8080/realms/booklatte")
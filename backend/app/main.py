@@ -4,16 +4,29 @@ It acts as the central point for assembling the different parts of the API,
 such as routers and middleware.
 """
 
+import os
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.api import upload  # Import the router from the 'upload.py' API module.
 from app.core.config import settings
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Process-wide setup done once at startup instead of on every request."""
+    # The trigger directory is shared with the observer via a volume.
+    os.makedirs(settings.trigger_dir, exist_ok=True)
+    yield
+
+
 # Create the main FastAPI application instance.
 # ...
 app = FastAPI(
     title="File Upload & Pipeline Service",
-    description="Handles file uploads and triggers a data processing pipeline."
+    description="Handles file uploads and triggers a data processing pipeline.",
+    lifespan=lifespan,
 )
 
 # Add CORS middleware to allow the frontend to communicate with the API.
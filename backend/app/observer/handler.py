@@ -7,11 +7,31 @@ is detected in the monitored directory.
 
 import logging
 import os
-import time
+import queue
+import threading
 from watchdog.events import FileSystemEventHandler
-from app.pipeline import run_all  # Import the main pipeline runner function.
 from app.core.config import settings
 
+# Window in which repeated create events for the trigger are coalesced.
+DEBOUNCE_SECONDS = settings.trigger_coalesce_ms / 1000
+# Under load the window stretches up to this many times DEBOUNCE_SECONDS.
+MAX_DEBOUNCE_FACTOR = 9
+
+def debounce_window() -> float:
+    """
+    Coalescing window for the next trigger: DEBOUNCE_SECONDS on an idle host,
+    growing with the 1-minute load average per CPU so bursts on a busy host
+    fold into fewer pipeline runs.
+    """
+    try:
+        load = os.getloadavg()[0] / (os.cpu_count() or 1)
+    except (AttributeError, OSError):  # Not available on this platform
+        return DEBOUNCE_SECONDS
+    return DEBOUNCE_SECONDS * min(1 + load, MAX_DEBOUNCE_FACTOR)
+
+# Queued in place of a trigger path to stop the pipeline worker.
+_STOP = object()
+
 class PipelineEventHandler(FileSystemEventHandler):
     """
     Handles file system events in the trigger directory. When the 'complete'
@@ -20,6 +40,13 @@ class PipelineEventHandler(FileSystemEventHandler):
     def __init__(self):
         """Initializes the handler and its logger."""
         self.logger = logging.getLogger(__name__)
+        self._debounce_timer = None
+        # Pipeline runs happen on one worker thread, so only one executes at a
+        # time and the observer thread is never blocked by a run. At most one
+        # trigger waits behind the running one; later triggers fold into it.
+        self._pending = queue.Queue(maxsize=1)
+        self._worker = threading.Thread(target=self._work, name="pipeline-worker", daemon=True)
+        self._worker.start()
 
     def on_created(self, event):
         """
@@ -33,31 +60,81 @@ class PipelineEventHandler(FileSystemEventHandler):
         # Check if the name of the created file is exactly "complete".
         # This is our specific trigger file.
         if os.path.basename(event.src_path) == "complete":
-            self.logger.info(f"--- Trigger file detected: {event.src_path} ---")
+            # Debounce: some platforms deliver the same creation more than once.
+            # Restarting the timer on each event collapses a burst into one run,
+            # and also gives the writer time to finish with the file.
+            if self._debounce_timer is not None:
+                self._debounce_timer.cancel()
+            self._debounce_timer = threading.Timer(debounce_window(), self._enqueue, args=[event.src_path])
+            self._debounce_timer.start()
+
+    def sweep(self, path):
+        """
+        Queues a run if the trigger file is already present in path. Covers a
+        trigger created while the observer was down, or whose creation event
+        was lost to an inotify queue overflow (watchdog drops IN_Q_OVERFLOW).
+        """
+        src_path = os.path.join(path, "complete")
+        if os.path.isfile(src_path):
+            self.logger.warning("Found trigger file without a creation event: %s", src_path)
+            self._enqueue(src_path)
+
+    def _enqueue(self, src_path):
+        """Hands a debounced trigger to the pipeline worker."""
+        try:
+            self._pending.put_nowait(src_path)
+        except queue.Full:
+            # A run is already waiting; it will pick up the same uploads.
+            self.logger.info("Pipeline run already pending, coalescing trigger: %s", src_path)
+
+    def _work(self):
+        """Pipeline worker loop: runs queued triggers one at a time until stopped."""
+        while True:
+            src_path = self._pending.get()
+            if src_path is _STOP:
+                return
+            self._fire(src_path)
+
+    def _fire(self, src_path):
+        """Runs the pipeline for a debounced trigger and removes the trigger file."""
+        self.logger.info("--- Trigger file detected: %s ---", src_path)
+
+        try:
+            # --- Runs ETL -> MBA -> PED -> NLP -> Holt-Winters ---
+            # Imported on first use: the pipeline pulls in pandas, numpy and the
+            # analytics stack, which an idle observer has no need to hold.
+            from app.pipeline import run_all
+            self.logger.info("Starting pipeline execution...")
+            run_all.execute_pipeline()
+            self.logger.info("--- Pipeline execution finished. ---")
             
-            # It's good practice to wait a very short moment. This can help ensure
-            # that the file write operation is fully finished before we try to act on it.
-            time.sleep(0.5) 
+        except Exception as e:
+            # If the pipeline fails for any reason, log the error.
+            self.logger.error("Pipeline execution failed: %s", e)
             
+        finally:
+            # CRITICAL STEP: Always attempt to remove the trigger file,
+            # whether the pipeline succeeded or failed. This "resets" the
+            # system, allowing it to be triggered again by a future upload.
             try:
-                # --- Runs ETL -> MBA -> PED -> NLP -> Holt-Winters ---
-                self.logger.info("Starting pipeline execution...")
-                run_all.execute_pipeline()
-                self.logger.info("--- Pipeline execution finished. ---")
-                
+                os.remove(src_path)
+                self.logger.info("Cleaned up trigger file: %s", src_path)
             except Exception as e:
-                # If the pipeline fails for any reason, log the error.
-                self.logger.error(f"Pipeline execution failed: {e}")
-                
-            finally:
-                # CRITICAL STEP: Always attempt to remove the trigger file,
-                # whether the pipeline succeeded or failed. This "resets" the
-                # system, allowing it to be triggered again by a future upload.
-                try:
-                    os.remove(event.src_path)
-                    self.logger.info(f"Cleaned up trigger file: {event.src_path}")
-                except Exception as e:
-                    self.logger.error(f"Failed to remove trigger file: {e}")
+                self.logger.error("Failed to remove trigger file: %s", e)
+
+    def close(self):
+        """
+        Stops the pipeline worker: drops a pending trigger that has not started,
+        then waits for a run in progress to finish.
+        """
+        if self._debounce_timer is not None:
+            self._debounce_timer.cancel()
+        try:
+            self._pending.get_nowait()
+        except queue.Empty:
+            pass
+        self._pending.put(_STOP)
+        self._worker.join()
 
     def on_modified(self, event):
         """
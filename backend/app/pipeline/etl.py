@@ -1,6 +1,10 @@
+import datetime
+import gzip
 import os
 import re
 import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from functools import lru_cache
 
 import numpy as np
@@ -11,56 +15,84 @@ from . import loader
 
 from app.core.config import settings
 from minio import Minio
+from minio.deleteobjects import DeleteObject
+from python_calamine import CalamineWorkbook
 import io
 import psycopg2
+from psycopg2.pool import ThreadedConnectionPool
+import urllib3
+import weakref
 
 # =========================
 # STAGING / COPY HELPERS (for buffer-based load)
 # =========================
 
+# Buckets already confirmed to exist in this process.
+_known_buckets_etl = set()
+
+# Staged CSVs are gzipped at level 1: most of the size win for little CPU.
+STAGING_COMPRESSION = {"method": "gzip", "compresslevel": 1, "mtime": 0}
+STAGING_CONTENT_TYPE = "application/gzip"
+
+@lru_cache(maxsize=1)
 def _get_minio_client_for_etl():
+    """Process-wide MinIO client; all staging calls share one connection pool."""
     return Minio(
         settings.minio_endpoint,
         access_key=settings.minio_access,
         secret_key=settings.minio_secret,
         secure=settings.minio_secure,
+        http_client=urllib3.PoolManager(
+            num_pools=4,
+            maxsize=64,
+            block=False,
+            timeout=urllib3.Timeout(connect=300, read=300),
+            retries=urllib3.Retry(total=3, backoff_factor=0.2),
+        ),
     )
 
 def _ensure_staging_bucket_for_etl():
-    client = _get_minio_client_for_etl()
     bucket = settings.minio_staging_bucket
+    if bucket in _known_buckets_etl:
+        return
+    client = _get_minio_client_for_etl()
     found = client.bucket_exists(bucket)
     if not found:
         client.make_bucket(bucket)
+    _known_buckets_etl.add(bucket)
 
-def _staging_put_bytes_etl(object_name: str, data: bytes, content_type: str = "text/csv") -> int:
+def _staging_put_buffer_etl(object_name: str, buf: io.BytesIO, content_type: str = "text/csv") -> int:
+    """Upload an in-memory buffer from its start without copying it out to bytes."""
     _ensure_staging_bucket_for_etl()
     client = _get_minio_client_for_etl()
-    bio = io.BytesIO(data)
+    length = buf.getbuffer().nbytes
+    buf.seek(0)
     client.put_object(
         bucket_name=settings.minio_staging_bucket,
         object_name=object_name,
-        data=bio,
-        length=len(data),
+        data=buf,
+        length=length,
         content_type=content_type,
     )
-    return len(data)
+    return length
 
-def _staging_get_bytes_etl(object_name: str) -> bytes:
+def _staging_open_stream_etl(object_name: str):
+    """Open a staged object for streaming; caller must close() and release_conn()."""
     client = _get_minio_client_for_etl()
-    resp = client.get_object(settings.minio_staging_bucket, object_name)
-    try:
-        return resp.read()
-    finally:
-        resp.close()
-        resp.release_conn()
+    return client.get_object(settings.minio_staging_bucket, object_name)
 
 def _staging_delete_prefix_etl(prefix: str) -> None:
     client = _get_minio_client_for_etl()
+    bucket = settings.minio_staging_bucket
     if prefix and not prefix.endswith('/'):
         prefix = prefix + '/'
-    for obj in client.list_objects(settings.minio_staging_bucket, prefix=prefix, recursive=True):
-        client.remove_object(settings.minio_staging_bucket, obj.object_name)
+    to_delete = (
+        DeleteObject(obj.object_name)
+        for obj in client.list_objects(bucket, prefix=prefix, recursive=True)
+    )
+    # remove_objects is lazy: errors must be iterated for the deletes to run.
+    for err in client.remove_objects(bucket, to_delete):
+        print(f"Failed to delete {err.name} from staging: {err.message}")
 
 def _clear_landing_bucket_etl() -> None:
     """
@@ -71,15 +103,23 @@ def _clear_landing_bucket_etl() -> None:
     bucket = settings.minio_landing_bucket
     
     print("Cleaning up landing bucket...")
-    deleted_count = 0
-    for obj in client.list_objects(bucket, recursive=True):
-        client.remove_object(bucket, obj.object_name)
-        deleted_count += 1
+    to_delete = [DeleteObject(obj.object_name) for obj in client.list_objects(bucket, recursive=True)]
+    deleted_count = len(to_delete)
+    for err in client.remove_objects(bucket, to_delete):
+        print(f"Failed to delete {err.name} from landing bucket: {err.message}")
+        deleted_count -= 1
     
     print(f"Deleted {deleted_count} objects from landing bucket: {bucket}")
 
-def _pg_connect_for_etl():
-    return psycopg2.connect(
+@lru_cache(maxsize=None)
+def _get_pg_pool_for_etl(pid: int) -> ThreadedConnectionPool:
+    """
+    Connection pool for process `pid`, created lazily on first use. Keyed by
+    pid so forked workers open their own sockets instead of sharing ours.
+    """
+    return ThreadedConnectionPool(
+        2,
+        settings.db_pool_size + settings.db_max_overflow,
         host=settings.db_host,
         port=settings.db_port,
         dbname=settings.db_name,
@@ -87,82 +127,162 @@ def _pg_connect_for_etl():
         password=settings.db_password,
     )
 
-def _upsert_via_temp_table(csv_bytes: bytes, table_name: str, columns: List[str], key_columns: List[str]) -> None:
+@contextmanager
+def _pg_connect_for_etl():
+    """Borrow a connection from the pool and hand it back when done."""
+    pool = _get_pg_pool_for_etl(os.getpid())
+    conn = pool.getconn()
+    try:
+        yield conn
+    finally:
+        pool.putconn(conn)
+
+# conn -> {table_name: (columns, key_columns)} for which temp_{table} and the
+# upsert_{table} prepared statement already exist in that session.
+_prepared_upserts_etl = weakref.WeakKeyDictionary()
+
+@lru_cache(maxsize=64)
+def _build_upsert_sql_etl(table_name: str, columns: tuple, key_columns: tuple) -> tuple:
     """
-    Load CSV to temp table via COPY, then UPSERT into final table.
+    SQL for one (table, columns, keys) shape:
+    (temp_table, create_temp_sql, copy_sql, prepare_sql).
     """
-    temp_table = f"temp_{table_name}_{int(time.time() * 1000)}"
+    # Always the session's own temp table, never a permanent temp_* table
+    # that search_path could otherwise resolve to
+    temp_table = f"pg_temp.temp_{table_name}"
     collist = ", ".join(f'"{c}"' for c in columns)
-    
-    with _pg_connect_for_etl() as conn:
+
+    create_sql = f"CREATE TEMP TABLE {temp_table} (LIKE {table_name} INCLUDING DEFAULTS) ON COMMIT PRESERVE ROWS"
+    copy_sql = f"COPY {temp_table} ({collist}) FROM STDIN WITH (FORMAT CSV, HEADER TRUE)"
+
+    if key_columns:
+        conflict_cols = ", ".join(f'"{c}"' for c in key_columns)
+        update_cols = [c for c in columns if c not in key_columns]
+
+        if update_cols:
+            set_clause = ", ".join(f'"{c}" = EXCLUDED."{c}"' for c in update_cols)
+            # Re-staged rows that match what is already stored are skipped
+            # instead of rewritten, so unchanged rows leave no dead tuples/WAL.
+            current_row = ", ".join(f'{table_name}."{c}"' for c in update_cols)
+            staged_row = ", ".join(f'EXCLUDED."{c}"' for c in update_cols)
+            upsert_sql = f"""
+                INSERT INTO {table_name} ({collist})
+                SELECT {collist} FROM {temp_table}
+                ON CONFLICT ({conflict_cols})
+                DO UPDATE SET {set_clause}
+                WHERE ROW({current_row}) IS DISTINCT FROM ROW({staged_row})
+            """
+        else:
+            upsert_sql = f"""
+                INSERT INTO {table_name} ({collist})
+                SELECT {collist} FROM {temp_table}
+                ON CONFLICT ({conflict_cols})
+                DO NOTHING
+            """
+    else:
+        # No key columns = plain insert
+        upsert_sql = f"INSERT INTO {table_name} ({collist}) SELECT {collist} FROM {temp_table}"
+
+    prepare_sql = f"PREPARE upsert_{table_name} AS {upsert_sql}"
+    return temp_table, create_sql, copy_sql, prepare_sql
+
+def _prepare_upsert_etl(cur, table_name: str, create_sql: str, prepare_sql: str) -> None:
+    """Create the session temp table and PREPARE the INSERT ... SELECT for it."""
+    cur.execute(f"DROP TABLE IF EXISTS pg_temp.temp_{table_name}")
+    cur.execute(create_sql)
+
+    cur.execute("SELECT 1 FROM pg_prepared_statements WHERE name = %s", (f"upsert_{table_name}",))
+    if cur.fetchone():
+        cur.execute(f"DEALLOCATE upsert_{table_name}")
+    cur.execute(prepare_sql)
+
+def _upsert_via_temp_table(conn, data_stream, table_name: str, columns: List[str], key_columns: List[str]) -> None:
+    """
+    Load CSV to temp table via COPY, then UPSERT into final table.
+    data_stream is any file-like object with read(); COPY pulls it in chunks.
+    Runs on the caller's connection and commits once the table is loaded.
+    The temp table and prepared upsert are set up once per session and
+    reused (COPY + EXECUTE + TRUNCATE) on later loads of the same table.
+    """
+    signature = (tuple(columns), tuple(key_columns))
+    temp_table, create_sql, copy_sql, prepare_sql = _build_upsert_sql_etl(table_name, *signature)
+    prepared = _prepared_upserts_etl.setdefault(conn, {})
+
+    try:
         with conn.cursor() as cur:
-            # Create temp table with same structure
-            cur.execute(f"CREATE TEMP TABLE {temp_table} (LIKE {table_name} INCLUDING DEFAULTS)")
-            
+            if prepared.get(table_name) != signature:
+                _prepare_upsert_etl(cur, table_name, create_sql, prepare_sql)
+                prepared[table_name] = signature
+
             # COPY into temp table
-            copy_sql = f"COPY {temp_table} ({collist}) FROM STDIN WITH (FORMAT CSV, HEADER TRUE)"
-            cur.copy_expert(copy_sql, io.StringIO(csv_bytes.decode('utf-8')))
-            
+            cur.copy_expert(copy_sql, data_stream)
+
             # UPSERT from temp to final
-            if key_columns:
-                conflict_cols = ", ".join(f'"{c}"' for c in key_columns)
-                update_cols = [c for c in columns if c not in key_columns]
-                
-                if update_cols:
-                    set_clause = ", ".join(f'"{c}" = EXCLUDED."{c}"' for c in update_cols)
-                    upsert_sql = f"""
-                        INSERT INTO {table_name} ({collist})
-                        SELECT {collist} FROM {temp_table}
-                        ON CONFLICT ({conflict_cols})
-                        DO UPDATE SET {set_clause}
-                    """
-                else:
-                    upsert_sql = f"""
-                        INSERT INTO {table_name} ({collist})
-                        SELECT {collist} FROM {temp_table}
-                        ON CONFLICT ({conflict_cols})
-                        DO NOTHING
-                    """
-                cur.execute(upsert_sql)
-            else:
-                # No key columns = plain insert
-                insert_sql = f"INSERT INTO {table_name} ({collist}) SELECT {collist} FROM {temp_table}"
-                cur.execute(insert_sql)
-            
-            # Drop temp table
-            cur.execute(f"DROP TABLE {temp_table}")
+            cur.execute(f"EXECUTE upsert_{table_name}")
+
+            # Leave the session temp table empty for the next load
+            cur.execute(f"TRUNCATE {temp_table}")
         conn.commit()
+    except Exception:
+        # A rolled-back transaction can take the temp table with it while the
+        # prepared statement survives; start this session over from scratch.
+        _prepared_upserts_etl.pop(conn, None)
+        try:
+            conn.rollback()
+            with conn.cursor() as cur:
+                cur.execute("DEALLOCATE ALL")
+            conn.commit()
+        except psycopg2.Error:
+            pass
+        raise
 
 def _bulk_upsert_from_staging_etl(prefix: str, plan: List[dict]) -> None:
     """
     Load CSVs from staging, UPSERT into PostgreSQL via temp tables.
     Each plan entry must have: table, filename, columns, key_columns
+    Each object is streamed from MinIO (gunzipped on the fly for .gz) into
+    COPY, so a staged CSV is never held in memory whole. Upserts run in plan
+    order on a single connection so FK dependencies between tables are
+    respected.
     """
     if prefix and not prefix.endswith('/'):
         prefix = prefix + '/'
-    for step in plan:
-        obj_name = prefix + step['filename']
-        csv_bytes = _staging_get_bytes_etl(obj_name)
-        _upsert_via_temp_table(
-            csv_bytes,
-            step['table'],
-            step['columns'],
-            step.get('key_columns', [])
-        )
+    if not plan:
+        return
+    with _pg_connect_for_etl() as conn:
+        for step in plan:
+            resp = _staging_open_stream_etl(prefix + step['filename'])
+            try:
+                data_stream = gzip.GzipFile(fileobj=resp) if step['filename'].endswith(".gz") else resp
+                _upsert_via_temp_table(
+                    conn,
+                    data_stream,
+                    step['table'],
+                    step['columns'],
+                    step.get('key_columns', [])
+                )
+            finally:
+                resp.close()
+                resp.release_conn()
 
 # =========================
 # NAMING HELPERS (for final outputs only)
 # =========================
 
+nonalnum_pattern = re.compile(r"[^0-9a-zA-Z]+")
+camel_pattern = re.compile(r"([a-z0-9])([A-Z])")
+underscores_pattern = re.compile(r"_+")
+
+@lru_cache(maxsize=4096)
 def to_snake_case(name: str) -> str:
     if not isinstance(name, str):
         return name
     name = name.strip()
     if not name:
         return name
-    name = re.sub(r"[^0-9a-zA-Z]+", "_", name)
-    name = re.sub(r"([a-z0-9])([A-Z])", r"\1_\2", name)
-    name = re.sub(r"_+", "_", name)
+    name = nonalnum_pattern.sub("_", name)
+    name = camel_pattern.sub(r"\1_\2", name)
+    name = underscores_pattern.sub("_", name)
     return name.strip("_").lower()
 
 def rename_columns_snake_case(df: pd.DataFrame) -> pd.DataFrame:
@@ -174,73 +294,98 @@ def rename_columns_snake_case(df: pd.DataFrame) -> pd.DataFrame:
 # INPUT PARSING (legacy behavior)
 # =========================
 
-def process_sales_file(file_obj):
-    """Process individual sales file to handle varying structures (legacy logic)."""
-    df = pd.read_excel(file_obj)
+def _normalize_cell(v):
+    """Map a calamine cell to what the openpyxl-backed read_excel produced."""
+    # calamine returns "" for empty cells, floats for every number and plain
+    # dates for date-only cells
+    if v is None or v == "":
+        return np.nan
+    if isinstance(v, float):
+        return int(v) if v.is_integer() else v
+    if type(v) is datetime.date:
+        return datetime.datetime(v.year, v.month, v.day)
+    return v
+
+def _read_excel_detect_header(file_obj, header_keywords) -> pd.DataFrame:
+    """
+    Stream the first sheet row by row (calamine reader) and build the frame
+    from the detected header row onward. Mirrors the legacy `pd.read_excel`
+    + header scan: blank rows are skipped, the first row is the title row,
+    and the header is the first of the next 10 rows holding one of
+    `header_keywords` as a whole cell (falling back to the 5th).
+    """
+    sheet = CalamineWorkbook.from_filelike(file_obj).get_sheet_by_index(0)
+    records = []
+    for row in sheet.iter_rows():
+        values = [_normalize_cell(v) for v in row]
+        if all(isinstance(v, float) and np.isnan(v) for v in values):
+            continue
+        records.append(values)
 
     header_row = None
-    for i in range(min(10, len(df))):
-        row_values = df.iloc[i].astype(str).str.lower()
-        if any(col in row_values.values for col in ["date", "receipt", "time"]):
+    for i in range(1, min(11, len(records))):
+        row_values = {str(v).lower() for v in records[i]}
+        if any(col in row_values for col in header_keywords):
             header_row = i
             break
 
     if header_row is None:
-        header_row = 4
+        header_row = 5
+
+    if header_row >= len(records):
+        return pd.DataFrame()
 
-    df.columns = df.iloc[header_row]
-    df = df[header_row + 1:].reset_index(drop=True)
+    # Build from the header row on so column dtypes are inferred exactly as
+    # the legacy frame (header cell included) inferred them.
+    width = max(len(r) for r in records)
+    df = pd.DataFrame([r + [np.nan] * (width - len(r)) for r in records[header_row:]])
+    df.columns = df.iloc[0]
+    df = df[1:].reset_index(drop=True)
     df = df.loc[:, ~df.columns.isna()]
     return df
 
-def process_product_file(file_obj):
-    """Process individual product file to handle varying structures (legacy logic)."""
-    df = pd.read_excel(file_obj)
-
-    header_row = None
-    for i in range(min(10, len(df))):
-        row_values = df.iloc[i].astype(str).str.lower()
-        if any(col in row_values.values for col in ["date", "receipt", "product", "item"]):
-            header_row = i
-            break
+def _parse_date_column(df: pd.DataFrame) -> pd.DataFrame:
+    """Parse Date to datetime64 once at ingestion; later phases rely on it."""
+    if "Date" in df.columns:
+        df["Date"] = pd.to_datetime(df["Date"], errors="coerce", dayfirst=False)
+    return df
 
-    if header_row is None:
-        header_row = 4
+def process_sales_file(file_obj):
+    """Process individual sales file to handle varying structures (legacy logic)."""
+    return _parse_date_column(_read_excel_detect_header(file_obj, ["date", "receipt", "time"]))
 
-    df.columns = df.iloc[header_row]
-    df = df[header_row + 1:].reset_index(drop=True)
-    df = df.loc[:, ~df.columns.isna()]
-    return df
+def process_product_file(file_obj):
+    """Process individual product file to handle varying structures (legacy logic)."""
+    return _parse_date_column(_read_excel_detect_header(file_obj, ["date", "receipt", "product", "item"]))
 
 # =========================
 # TIME DIMENSION
 # =========================
 
+@lru_cache(maxsize=1)
+def _build_time_dimension() -> pd.DataFrame:
+    hours = np.char.zfill(np.arange(24).astype(str), 2)
+    minutes = np.char.zfill(np.arange(60).astype(str), 2)
+    hour_ids = np.char.add("H", hours)
+
+    minute_hours = np.repeat(hours, 60)
+    minute_mins = np.tile(minutes, 24)
+    minute_parents = np.repeat(hour_ids, 60)
+
+    return pd.DataFrame({
+        "time_id": np.concatenate([hour_ids, np.char.add(np.char.add(minute_parents, "M"), minute_mins)]),
+        "time_desc": np.concatenate([hours, np.char.add(np.char.add(minute_hours, ":"), minute_mins)]),
+        "time_level": np.concatenate([np.ones(24, dtype=np.int64), np.zeros(24 * 60, dtype=np.int64)]),
+        "parent_id": np.concatenate([np.full(24, "NA"), minute_parents]),
+    })
+
 def create_time_dimension(_date_series):
     """
     Create a time dimension with hours (H01-H23) and minutes (H01M00-H23M59).
-    Ignores input; kept for legacy compatibility.
+    Ignores input; kept for legacy compatibility. The frame is built once and
+    copied per call.
     """
-    hour_rows = []
-    for h in range(0, 24):
-        hour_rows.append({
-            "time_id": f"H{h:02}",
-            "time_desc": f"{h:02}",
-            "time_level": 1,
-            "parent_id": "NA",
-        })
-
-    minute_rows = []
-    for h in range(0, 24):
-        for m in range(0, 60):
-            minute_rows.append({
-                "time_id": f"H{h:02}M{m:02}",
-                "time_desc": f"{h:02}:{m:02}",
-                "time_level": 0,
-                "parent_id": f"H{h:02}",
-            })
-
-    return pd.DataFrame(hour_rows + minute_rows)
+    return _build_time_dimension().copy()
 
 # =========================
 # COSTING (legacy heuristic)
@@ -258,6 +403,21 @@ def normalize_drink_name(name: str) -> str:
         .replace("CHOCO", "CHOCOLATE")
     )
 
+@lru_cache(maxsize=1)
+def _load_costing_book() -> dict:
+    """
+    Parse the first raw_costing/*.xlsx once: {sheet_name: (normalized_name, df)}.
+    Empty dict when no costing workbook is present.
+    """
+    import glob
+
+    costing_files = glob.glob("raw_costing/*.xlsx")
+    if not costing_files:
+        return {}
+
+    sheets = pd.read_excel(costing_files[0], sheet_name=None, header=None)
+    return {name: (normalize_drink_name(name), df) for name, df in sheets.items()}
+
 @lru_cache(maxsize=None)
 def get_drink_cost(product_name: str) -> float | None:
     """
@@ -266,21 +426,17 @@ def get_drink_cost(product_name: str) -> float | None:
     - Picks sheet via fuzzy score
     - Reads numeric from row 35
     """
-    import glob
-
     try:
-        costing_files = glob.glob("raw_costing/*.xlsx")
-        if not costing_files:
+        book = _load_costing_book()
+        if not book:
             return None
 
-        xl = pd.ExcelFile(costing_files[0])
         product_norm = normalize_drink_name(product_name)
 
         best_match = None
         best_score = 0
 
-        for sheet in xl.sheet_names:
-            sheet_norm = normalize_drink_name(sheet)
+        for sheet, (sheet_norm, _) in book.items():
             score = 0
 
             # Note: product_norm has no spaces; kept for parity with legacy.
@@ -303,7 +459,7 @@ def get_drink_cost(product_name: str) -> float | None:
                 best_match = sheet
 
         if best_match and best_score >= 2:
-            df = pd.read_excel(costing_files[0], sheet_name=best_match, header=None)
+            df = book[best_match][1]
             if len(df) > 35:
                 row_35 = df.iloc[35]
                 for col in range(1, len(row_35)):
@@ -322,7 +478,10 @@ drink_keywords = {
     "ICED", "ICE", "HOT", "8OZ", "12OZ", "16OZ", "COLD",
     "TEA", "LATTE", "SHAKE", "FRAPPE", "MOCHA", "GLASS", "PITCHER", "WATER"
 }
-token_pattern = re.compile(r"[A-Z0-9]+")
+# A drink keyword must be a whole [A-Z0-9]+ token of the upper-cased name.
+drink_token_regex = re.compile(
+    r"(?<![A-Z0-9])(?:" + "|".join(map(re.escape, sorted(drink_keywords))) + r")(?![A-Z0-9])"
+)
 others_triggers = ["CHARGING"]
 others_word_regex = re.compile(r"\bTAKE\b")
 extra_phrase_triggers = ["BOTTLED WATER", "PLAIN RICE"]
@@ -332,23 +491,24 @@ extra_word_triggers = [
     re.compile(r"\bEXTRA\b"),
 ]
 
+parent_sku_zero_oz_regex = re.compile(r"\b(8|12|16)0Z\b")
+parent_sku_size_pattern = re.compile(r"\b(8|12|16)\s*(?:O|0)Z\.?(?=\b)")
+parent_sku_triggers = {"ICED", "ICE", "HOT", "COLD"}
+parent_sku_dropped_tokens = parent_sku_triggers | {"OZ", "8", "12", "16"}
+
+@lru_cache(maxsize=None)
 def compute_parent_sku(name: str) -> str:
     if not isinstance(name, str) or name.strip() == "":
         return ""
     original = name.upper().strip()
     work = original.replace(".", " ")
-    work = re.sub(r"\b(8|12|16)0Z\b", lambda m: m.group(1) + "OZ", work)
-    size_pattern = re.compile(r"\b(8|12|16)\s*(?:O|0)Z\.?(?=\b)")
-    triggers = {"ICED", "ICE", "HOT", "COLD"}
+    work = parent_sku_zero_oz_regex.sub(r"\1OZ", work)
 
-    has_trigger = any(t in work.split() for t in triggers) or bool(size_pattern.search(work))
+    work_tokens = work.split()
+    has_trigger = not parent_sku_triggers.isdisjoint(work_tokens) or bool(parent_sku_size_pattern.search(work))
     if has_trigger:
-        work = size_pattern.sub("", work)
-        tokens = [
-            tok for tok in work.split()
-            if tok not in triggers and tok not in {"OZ"}
-        ]
-        tokens = [tok for tok in tokens if tok not in {"8", "12", "16"}]
+        work = parent_sku_size_pattern.sub("", work)
+        tokens = [tok for tok in work.split() if tok not in parent_sku_dropped_tokens]
         if not tokens:
             tokens = original.split()
     else:
@@ -358,6 +518,40 @@ def compute_parent_sku(name: str) -> str:
         tokens.pop()
     return "-".join(tokens)
 
+def _upper_str_series(values: pd.Series) -> pd.Series:
+    """Upper-cased strings; non-string cells become NaN (the scalar helpers ignore them)."""
+    values = values.astype(object)
+    values = values.where(values.map(lambda v: isinstance(v, str)).astype(bool))
+    return values.str.upper()
+
+# Column-wise equivalents of the compute_parent_sku steps. Token tests use
+# whitespace lookarounds so they agree with the str.split() membership checks.
+parent_sku_size_regex = re.compile(r"\b(?:8|12|16)\s*(?:O|0)Z\.?(?=\b)")
+parent_sku_trigger_regex = r"(?<!\S)(?:ICED|ICE|HOT|COLD)(?!\S)"
+parent_sku_drop_regex = r"(?<!\S)(?:ICED|ICE|HOT|COLD|OZ|8|12|16)(?!\S)"
+parent_sku_suffix_regex = r"(?:(?:^| )[123])+$"
+
+def compute_parent_sku_series(names: pd.Series) -> pd.Series:
+    """Vectorized compute_parent_sku; returns a Series aligned with names."""
+    names = _upper_str_series(names).str.strip().fillna("")
+    original = names.str.split().str.join(" ")
+
+    work = names.str.replace(".", " ", regex=False)
+    work = work.str.replace(r"\b(8|12|16)0Z\b", r"\1OZ", regex=True)
+    has_trigger = (
+        work.str.contains(parent_sku_trigger_regex, regex=True)
+        | work.str.contains(parent_sku_size_regex, regex=True)
+    )
+
+    stripped = work.str.replace(parent_sku_size_regex, "", regex=True)
+    stripped = stripped.str.replace(parent_sku_drop_regex, " ", regex=True)
+    stripped = stripped.str.split().str.join(" ")
+
+    tokens = original.where(~has_trigger | (stripped == ""), stripped)
+    tokens = tokens.str.replace(parent_sku_suffix_regex, "", regex=True)
+    return tokens.str.replace(" ", "-", regex=False)
+
+@lru_cache(maxsize=None)
 def infer_category(product_name: str, product_id: str) -> str:
     if not isinstance(product_name, str):
         product_name = ""
@@ -371,8 +565,7 @@ def infer_category(product_name: str, product_id: str) -> str:
     ):
         return "EXTRA"
 
-    tokens = {t.upper() for t in token_pattern.findall(upper_name)}
-    category = "DRINK" if tokens & drink_keywords else "FOOD"
+    category = "DRINK" if drink_token_regex.search(upper_name) else "FOOD"
 
     if isinstance(product_id, str):
         upid = product_id.upper()
@@ -381,6 +574,40 @@ def infer_category(product_name: str, product_id: str) -> str:
 
     return category
 
+# Column-wise equivalents of the infer_category rules.
+others_series_regex = "|".join([*map(re.escape, others_triggers), others_word_regex.pattern])
+extra_series_regex = "|".join([*map(re.escape, extra_phrase_triggers), *(r.pattern for r in extra_word_triggers)])
+
+def infer_category_series(product_names: pd.Series, product_ids: pd.Series) -> np.ndarray:
+    """Vectorized infer_category over aligned name/id columns (same rules, same order)."""
+    upper_name = _upper_str_series(product_names)
+    upper_id = _upper_str_series(product_ids)
+
+    m_others = upper_name.str.contains(others_series_regex, regex=True, na=False)
+    m_extra = upper_name.str.contains(extra_series_regex, regex=True, na=False)
+    m_drink = upper_name.str.contains(drink_token_regex, regex=True, na=False)
+    m_id_drink = upper_id.str.contains("DRNKS|DKS", regex=True, na=False)
+
+    return np.select(
+        [m_others.to_numpy(bool), m_extra.to_numpy(bool), (m_drink | m_id_drink).to_numpy(bool)],
+        ["OTHERS", "EXTRA", "DRINK"],
+        default="FOOD",
+    )
+
+def parent_sku_and_category_series(frame: pd.DataFrame) -> tuple:
+    """
+    (parent_sku, CATEGORY) arrays for frame's product_name / product_id rows.
+    Names repeat heavily across history rows, so both are computed once per
+    distinct (product_name, product_id) pair and broadcast back by group code.
+    """
+    keys = frame[["product_name", "product_id"]]
+    codes = keys.groupby(["product_name", "product_id"], dropna=False, sort=False).ngroup().to_numpy()
+    unique = keys.drop_duplicates()
+
+    parent_sku = compute_parent_sku_series(unique["product_name"]).to_numpy(object)
+    category = infer_category_series(unique["product_name"], unique["product_id"])
+    return parent_sku[codes], category[codes]
+
 def calculate_product_cost(product_name: str, category: str, price):
     if category == "DRINK":
         cost = get_drink_cost(product_name)
@@ -388,23 +615,79 @@ def calculate_product_cost(product_name: str, category: str, price):
             return cost
     return round(price * 0.60, 2) if pd.notna(price) else np.nan
 
+def calculate_product_cost_series(frame: pd.DataFrame) -> pd.Series:
+    """
+    Vectorized calculate_product_cost over product_name / CATEGORY / Price.
+    get_drink_cost runs once per distinct drink name and the 60% rounding
+    once per distinct price, so results match the scalar version exactly.
+    """
+    names = frame["product_name"]
+    prices = frame["Price"] if "Price" in frame.columns else pd.Series(np.nan, index=frame.index)
+    is_drink = frame["CATEGORY"].eq("DRINK") if "CATEGORY" in frame.columns else pd.Series(False, index=frame.index)
+
+    drink_costs = pd.Series({n: get_drink_cost(n) for n in names[is_drink].unique()}, dtype=float)
+    fallback_costs = {p: round(p * 0.60, 2) for p in prices.dropna().unique()}
+
+    drink_cost = names.map(drink_costs).astype(float)
+    fallback = prices.map(fallback_costs).astype(float)
+    return drink_cost.where(is_drink & drink_cost.notna() & drink_cost.ne(0), fallback)
+
 # =========================
 # EXTRACT (MinIO landing)
 # =========================
 
+def _report_overlaps(ranges: List[dict]) -> None:
+    """
+    Warn about every pair of files whose [min_date, max_date] ranges overlap.
+    Sort-and-sweep: after sorting by min_date, a range can only overlap the
+    still-open ranges before it. Pairs are reported in file order.
+    """
+    order = sorted(range(len(ranges)), key=lambda k: ranges[k]["min_date"])
+    open_ranges: List[int] = []
+    pairs = []
+    for k in order:
+        start = ranges[k]["min_date"]
+        open_ranges = [a for a in open_ranges if ranges[a]["max_date"] >= start]
+        pairs.extend((min(a, k), max(a, k)) for a in open_ranges)
+        open_ranges.append(k)
+
+    for i, j in sorted(pairs):
+        r1, r2 = ranges[i], ranges[j]
+        overlap_start = max(r1["min_date"], r2["min_date"])
+        overlap_end = min(r1["max_date"], r2["max_date"])
+        print("\nWARNING: Overlap detected!")
+        print(f"  Files: '{r1['file']}' and '{r2['file']}'")
+        print(
+            f"  Overlap period: {overlap_start:%Y-%m-%d} to {overlap_end:%Y-%m-%d}"
+        )
+
+# Columns transform() never uses. extract() already drops them per file so
+# the concat does not copy them; transform() drops them again defensively.
+cols_drop_sales = [
+    "Posted", "Price Level", "Branch", "TM#", "Customer ID", "Customer Name",
+    "Cashier", "Serviced By", "Dine In", "Take Out", "Local Tax", "Amusement Tax",
+    "EWT", "NAC", "Solo Parent", "Service", "Feedback Rating", "Diplomat"
+]
+cols_drop_prod = [
+    "Lot/Serial", "Posted", "TM#", "Unit", "Discount ID", "Discount",
+    "% Discount", "Price ID", "Branch", "Customer ID", "Customer"
+]
+
 def extract():
     print("=== EXTRACT PHASE ===")
 
     # Sales Transactions from MinIO
     print("Extracting Excel Sales Transactions List from MinIO landing/raw_sales_by_transaction ...")
     sales_files_meta = loader.get_sales_files_from_minio()
-    sales_dfs = [process_sales_file(m["fileobj"]) for m in sales_files_meta] if sales_files_meta else []
+    sales_dfs = [
+        process_sales_file(m["fileobj"]).drop(columns=cols_drop_sales, errors="ignore")
+        for m in sales_files_meta
+    ] if sales_files_meta else []
 
     print("\nChecking for date range overlaps in sales files...")
     file_date_ranges = []
     for m, df in zip(sales_files_meta, sales_dfs):
         if "Date" in df.columns:
-            df["Date"] = pd.to_datetime(df["Date"], errors="coerce")
             valid = df["Date"].dropna()
             if not valid.empty:
                 file_date_ranges.append({
@@ -417,44 +700,28 @@ def extract():
                     f"{valid.min():%Y-%m-%d} to {valid.max():%Y-%m-%d}"
                 )
 
-    for i in range(len(file_date_ranges)):
-        for j in range(i + 1, len(file_date_ranges)):
-            r1, r2 = file_date_ranges[i], file_date_ranges[j]
-            if r1["min_date"] <= r2["max_date"] and r2["min_date"] <= r1["max_date"]:
-                overlap_start = max(r1["min_date"], r2["min_date"])
-                overlap_end = min(r1["max_date"], r2["max_date"])
-                print("\nWARNING: Overlap detected!")
-                print(f"  Files: '{r1['file']}' and '{r2['file']}'")
-                print(
-                    f"  Overlap period: {overlap_start:%Y-%m-%d} to {overlap_end:%Y-%m-%d}"
-                )
+    _report_overlaps(file_date_ranges)
     print()
 
-    all_cols = set()
-    for df in sales_dfs:
-        all_cols.update(df.columns)
-    for i, df in enumerate(sales_dfs):
-        for c in all_cols:
-            if c not in df.columns:
-                df[c] = None
-        sales_dfs[i] = df[sorted(all_cols)]
-    sales_df = pd.concat(sales_dfs, ignore_index=True) if sales_dfs else pd.DataFrame()
-
-    if "Date" in sales_df.columns:
-        sales_df["Date"] = pd.to_datetime(sales_df["Date"], errors="coerce", dayfirst=False)
+    # concat aligns differing headers (missing cells become NaN); columns are
+    # then put in sorted order once, as the per-file alignment used to do.
+    sales_df = pd.concat(sales_dfs, ignore_index=True, sort=True) if sales_dfs else pd.DataFrame()
+    sales_df = sales_df.reindex(columns=sorted(sales_df.columns))
 
     # Sales by Product from MinIO
     print(
         "Extracting Excel Sales Report by Product List from MinIO landing/raw_sales_by_product ..."
     )
     prod_files_meta = loader.get_sales_by_product_files_from_minio()
-    prod_dfs = [process_product_file(m["fileobj"]) for m in prod_files_meta] if prod_files_meta else []
+    prod_dfs = [
+        process_product_file(m["fileobj"]).drop(columns=cols_drop_prod, errors="ignore")
+        for m in prod_files_meta
+    ] if prod_files_meta else []
 
     print("\nChecking for date range overlaps in sales by product files...")
     prod_ranges = []
     for m, df in zip(prod_files_meta, prod_dfs):
         if "Date" in df.columns:
-            df["Date"] = pd.to_datetime(df["Date"], errors="coerce", dayfirst=False)
             valid = df["Date"].dropna()
             if not valid.empty:
                 prod_ranges.append({
@@ -467,39 +734,21 @@ def extract():
                     f"{valid.min():%Y-%m-%d} to {valid.max():%Y-%m-%d}"
                 )
 
-    for i in range(len(prod_ranges)):
-        for j in range(i + 1, len(prod_ranges)):
-            r1, r2 = prod_ranges[i], prod_ranges[j]
-            if r1["min_date"] <= r2["max_date"] and r2["min_date"] <= r1["max_date"]:
-                overlap_start = max(r1["min_date"], r2["min_date"])
-                overlap_end = min(r1["max_date"], r2["max_date"])
-                print("\nWARNING: Overlap detected!")
-                print(f"  Files: '{r1['file']}' and '{r2['file']}'")
-                print(
-                    f"  Overlap period: {overlap_start:%Y-%m-%d} to {overlap_end:%Y-%m-%d}"
-                )
+    _report_overlaps(prod_ranges)
     print()
 
-    all_prod_cols = set()
-    for df in prod_dfs:
-        all_prod_cols.update(df.columns)
-    for i, df in enumerate(prod_dfs):
-        for c in all_prod_cols:
-            if c not in df.columns:
-                df[c] = None
-        prod_dfs[i] = df[sorted(all_prod_cols)]
-    sales_by_product_df = pd.concat(prod_dfs, ignore_index=True) if prod_dfs else pd.DataFrame()
-
-    if "Date" in sales_by_product_df.columns:
-        sales_by_product_df["Date"] = pd.to_datetime(sales_by_product_df["Date"], errors="coerce", dayfirst=False)
-    if "Date" in sales_df.columns:
-        sales_df["Date"] = pd.to_datetime(sales_df["Date"], errors="coerce", dayfirst=False)
+    sales_by_product_df = pd.concat(prod_dfs, ignore_index=True, sort=True) if prod_dfs else pd.DataFrame()
+    sales_by_product_df = sales_by_product_df.reindex(columns=sorted(sales_by_product_df.columns))
 
     if "Take Out" in sales_by_product_df.columns:
-        sales_by_product_df["Take Out"] = sales_by_product_df["Take Out"].apply(
-            lambda x: "True"
-            if str(x).strip().upper() == "Y"
-            else ("False" if pd.isna(x) or str(x).strip() == "" else x)
+        # Stays the strings "True"/"False" with other flags passed through
+        # (ETL.md section 7).
+        take_out = sales_by_product_df["Take Out"]
+        flag = take_out.astype(str).str.strip().str.upper()
+        sales_by_product_df["Take Out"] = np.where(
+            flag.eq("Y"),
+            "True",
+            np.where(take_out.isna() | flag.eq(""), "False", take_out.to_numpy(dtype=object)),
         )
 
     print("Extract phase completed successfully.")
@@ -509,79 +758,119 @@ def extract():
 # TRANSFORM (legacy logic, no CSV writes)
 # =========================
 
+def _non_blank_mask(values: pd.Series) -> pd.Series:
+    """
+    notna() and not a whitespace-only string. Only string cells can be blank
+    once stringified, so non-string cells (e.g. datetime.time) are not
+    formatted just to be checked.
+    """
+    mask = values.notna()
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return mask
+    if pd.api.types.is_string_dtype(values) and values.dtype != object:
+        return mask & values.str.strip().ne("").fillna(False)
+    is_str = values.map(lambda v: isinstance(v, str)).astype(bool)
+    blank = values.where(is_str, "x").astype(object).str.strip().eq("")
+    return mask & ~blank
+
+def _time_offset(times: pd.Series):
+    """
+    Time of day as a timedelta Series, or None when the cells are not all in
+    one clean shape (uniform HH:MM or HH:MM:SS strings, or whole-second
+    datetime.time values) and the legacy string parse has to decide.
+    """
+    present = times.dropna()
+    if present.empty:
+        return None
+    is_str = pd.api.types.is_string_dtype(present) and present.dtype != object
+    if is_str or present.map(lambda v: isinstance(v, str)).all():
+        lengths = present.str.len()
+        width = lengths.iloc[0]
+        if width not in (5, 8) or (lengths != width).any():
+            return None
+        # Fixed-width HH:MM[:SS], checked and read straight off the code points
+        codes = present.to_numpy(dtype=f"U{width}").view(np.uint32).reshape(-1, width)
+        colons = list(range(2, width, 3))
+        digit_cols = [i for i in range(width) if i not in colons]
+        if (codes[:, colons] != ord(":")).any():
+            return None
+        digits = codes[:, digit_cols].astype(np.int64) - ord("0")
+        if ((digits < 0) | (digits > 9)).any():
+            return None
+        hours = digits[:, 0] * 10 + digits[:, 1]
+        minutes = digits[:, 2] * 10 + digits[:, 3]
+        secs = digits[:, 4] * 10 + digits[:, 5] if width == 8 else 0
+        if (hours > 23).any() or (minutes > 59).any() or np.any(secs > 59):
+            return None
+        seconds = pd.Series(hours * 3600 + minutes * 60 + secs, index=present.index)
+    elif present.map(lambda v: type(v) is datetime.time and v.microsecond == 0).all():
+        seconds = pd.Series(
+            [v.hour * 3600 + v.minute * 60 + v.second for v in present], index=present.index
+        )
+    else:
+        return None
+    return pd.to_timedelta(seconds.reindex(times.index), unit="s")
+
+def _combine_date_time(dates: pd.Series, times: pd.Series) -> pd.Series:
+    """
+    Date + Time as one datetime column. Midnight dates get the time added as
+    an offset; anything else keeps the legacy `Date + " " + Time` parse.
+    """
+    if pd.api.types.is_datetime64_any_dtype(dates):
+        present = dates.dropna()
+        if (present == present.dt.normalize()).all():
+            offset = _time_offset(times)
+            if offset is not None:
+                return (dates + offset).dt.as_unit(dates.dt.unit)
+    return pd.to_datetime(dates.astype(str) + " " + times.astype(str), errors="coerce")
+
 def transform(sales_df, sales_by_product_df):
     print("=== TRANSFORM PHASE ===")
     print("Cleaning Data...")
 
     # Sales cleaning
-    cols_drop_sales = [
-        "Posted", "Price Level", "Branch", "TM#", "Customer ID", "Customer Name",
-        "Cashier", "Serviced By", "Dine In", "Take Out", "Local Tax", "Amusement Tax",
-        "EWT", "NAC", "Solo Parent", "Service", "Feedback Rating", "Diplomat"
-    ]
     sales_df = sales_df.drop(
         columns=[c for c in cols_drop_sales if c in sales_df.columns],
         errors="ignore",
     )
 
+    # All row filters are AND-ed into one mask and applied with a single
+    # copy. Date is already datetime64 (parsed at ingestion), so notna() suffices.
+    keep = pd.Series(True, index=sales_df.index)
     if "Date" in sales_df.columns:
-        sales_df = sales_df[
-            sales_df["Date"].notna()
-            & (sales_df["Date"].astype(str).str.strip() != "")
-        ].reset_index(drop=True)
-
+        keep &= sales_df["Date"].notna()
     if "Time" in sales_df.columns:
-        sales_df = sales_df[
-            sales_df["Time"].notna()
-            & (sales_df["Time"].astype(str).str.strip() != "")
-        ].reset_index(drop=True)
+        keep &= _non_blank_mask(sales_df["Time"])
+    sales_df = sales_df[keep].reset_index(drop=True)
 
     # Sales by Product cleaning
-    cols_drop_prod = [
-        "Lot/Serial", "Posted", "TM#", "Unit", "Discount ID", "Discount",
-        "% Discount", "Price ID", "Branch", "Customer ID", "Customer"
-    ]
     sales_by_product_df = sales_by_product_df.drop(
         columns=[c for c in cols_drop_prod if c in sales_by_product_df.columns],
         errors="ignore",
     )
 
+    keep = pd.Series(True, index=sales_by_product_df.index)
     if "Date" in sales_by_product_df.columns:
-        sales_by_product_df = sales_by_product_df[
-            sales_by_product_df["Date"].notna()
-            & (sales_by_product_df["Date"].astype(str).str.strip() != "")
-        ].reset_index(drop=True)
+        keep &= sales_by_product_df["Date"].notna()
 
     if "Time" in sales_by_product_df.columns:
-        sales_by_product_df = sales_by_product_df[
-            sales_by_product_df["Time"].notna()
-            & (sales_by_product_df["Time"].astype(str).str.strip() != "")
-        ].reset_index(drop=True)
+        keep &= _non_blank_mask(sales_by_product_df["Time"])
 
         # Outlier filter for Price inside this block (legacy behavior)
         if "Price" in sales_by_product_df.columns:
-            sales_by_product_df = sales_by_product_df[
-                pd.to_numeric(sales_by_product_df["Price"], errors="coerce").between(0, 50000)
-            ].reset_index(drop=True)
+            keep &= pd.to_numeric(sales_by_product_df["Price"], errors="coerce").between(0, 50000)
 
         for col in ["Qty", "Line Total", "Net Total", "Price"]:
             if col in sales_by_product_df.columns:
-                sales_by_product_df = sales_by_product_df[
-                    pd.to_numeric(sales_by_product_df[col], errors="coerce") >= 0
-                ].reset_index(drop=True)
+                keep &= pd.to_numeric(sales_by_product_df[col], errors="coerce") >= 0
+    sales_by_product_df = sales_by_product_df[keep].reset_index(drop=True)
 
     # Create DateTime columns by combining Date and Time
     if "Date" in sales_df.columns and "Time" in sales_df.columns:
-        sales_df["DateTime"] = pd.to_datetime(
-            sales_df["Date"].astype(str) + " " + sales_df["Time"].astype(str),
-            errors="coerce"
-        )
+        sales_df["DateTime"] = _combine_date_time(sales_df["Date"], sales_df["Time"])
     
     if "Date" in sales_by_product_df.columns and "Time" in sales_by_product_df.columns:
-        sales_by_product_df["DateTime"] = pd.to_datetime(
-            sales_by_product_df["Date"].astype(str) + " " + sales_by_product_df["Time"].astype(str),
-            errors="coerce"
-        )
+        sales_by_product_df["DateTime"] = _combine_date_time(sales_by_product_df["Date"], sales_by_product_df["Time"])
 
     # Standardization rules (copied as-is from legacy)
     if "Product ID" in sales_by_product_df.columns and "Product Name" in sales_by_product_df.columns:
@@ -747,17 +1036,37 @@ def transform(sales_df, sales_by_product_df):
                 n.strip().upper() for n in rule.get("from_names", [])
             }
 
-        for rule in standardization_rules:
-            mask_id = sales_by_product_df["Product ID"].astype(str).isin(
-                rule.get("from_ids", [])
-            )
-            mask_name = sales_by_product_df["Product Name"].astype(str).str.strip().str.upper().isin(
-                rule.get("from_names_upper", set())
-            )
-            mask = mask_id | mask_name
-            if mask.any():
-                sales_by_product_df.loc[mask, "Product ID"] = rule["to_id"]
-                sales_by_product_df.loc[mask, "Product Name"] = rule["to_name"]
+        # Rules apply in order, so a row takes the first rule matching its
+        # original id/name, and later rules may then rewrite that rule's
+        # output. Resolve each rule's final (id, name) once, then map rows
+        # to their first matching rule in a single pass.
+        first_rule_by_id = {}
+        first_rule_by_name = {}
+        resolved_ids = []
+        resolved_names = []
+        for idx, rule in enumerate(standardization_rules):
+            for fid in rule.get("from_ids", []):
+                first_rule_by_id.setdefault(fid, idx)
+            for name in rule["from_names_upper"]:
+                first_rule_by_name.setdefault(name, idx)
+
+            to_id, to_name = rule["to_id"], rule["to_name"]
+            for later in standardization_rules[idx + 1:]:
+                if to_id in later.get("from_ids", []) or to_name.strip().upper() in later["from_names_upper"]:
+                    to_id, to_name = later["to_id"], later["to_name"]
+            resolved_ids.append(to_id)
+            resolved_names.append(to_name)
+
+        rule_by_id = sales_by_product_df["Product ID"].astype(str).map(first_rule_by_id)
+        rule_by_name = (
+            sales_by_product_df["Product Name"].astype(str).str.strip().str.upper().map(first_rule_by_name)
+        )
+        first_rule = np.fmin(rule_by_id.to_numpy(float), rule_by_name.to_numpy(float))
+        mask = ~np.isnan(first_rule)
+        if mask.any():
+            hits = first_rule[mask].astype(int)
+            sales_by_product_df.loc[mask, "Product ID"] = np.array(resolved_ids, dtype=object)[hits]
+            sales_by_product_df.loc[mask, "Product Name"] = np.array(resolved_names, dtype=object)[hits]
 
     # Normalize Product IDs by first-seen Product Name
     if "Product ID" in sales_by_product_df.columns and "Product Name" in sales_by_product_df.columns:
@@ -814,15 +1123,18 @@ def transform(sales_df, sales_by_product_df):
     # Merge sales & by-product
     print("Merging Sales Transaction and Sales by Product List")
     if "Receipt No" in sales_df.columns and "Receipt No" in sales_by_product_df.columns:
+        # The by-product Date would come out as Date_product and be dropped;
+        # leave it out of the join instead of copying it into the result.
+        if "Date" in sales_df.columns and "Date" in sales_by_product_df.columns:
+            sales_by_product_df = sales_by_product_df.drop(columns=["Date"])
         combined_df = pd.merge(
             sales_df,
             sales_by_product_df,
             on="Receipt No",
             suffixes=("", "_product"),
             how="inner",
+            sort=False,
         )
-        if "Date_product" in combined_df.columns:
-            combined_df = combined_df.drop(columns=["Date_product"])
     else:
         print("Warning: Receipt No column not found in one or both dataframes")
         combined_df = pd.DataFrame()
@@ -834,30 +1146,18 @@ def transform(sales_df, sales_by_product_df):
 # PRODUCT DIMENSIONS - FULL BUILD
 # =========================
 
-def create_product_dimensions_full(combined_df: pd.DataFrame):
+def _insert_product_cost(dim: pd.DataFrame) -> None:
+    """Add product_cost right after Price (at the end when there is none)."""
+    cost_pos = dim.columns.get_loc("Price") + 1 if "Price" in dim.columns else len(dim.columns)
+    dim.insert(cost_pos, "product_cost", calculate_product_cost_series(dim))
+
+def _build_current_product_dim(df: pd.DataFrame, available_product_columns: List[str]) -> pd.DataFrame:
     """
-    Original behavior:
-    - Build full current_product_dimension from all data.
-    - Build history_product_dimension with one row per distinct (product_id, product_name, Price).
-    - Mark latest record_version as is_current.
-    Used when there is no existing history_product_dimension.
+    Latest row per product_id. Only the dimension's columns are aggregated;
+    groupby.last() semantics (last non-null per column) are kept.
     """
-    if "Product ID" not in combined_df.columns or "Product Name" not in combined_df.columns:
-        print("Warning: Required product columns (Product ID, Product Name) not found")
-        return None, None
-
-    df = combined_df.copy()
-    df = df.rename(columns={"Product ID": "product_id", "Product Name": "product_name"})
-
-    product_columns = ["product_id", "product_name", "Price"]
-    available_product_columns = [c for c in product_columns if c in df.columns]
-    if "DateTime" in df.columns:
-        available_product_columns.append("DateTime")
-    elif "Date" in df.columns:
-        available_product_columns.append("Date")
-
-    # Current: latest row per product_id
-    current_products = df.groupby("product_id").last().reset_index()
+    value_columns = [c for c in available_product_columns if c != "product_id"]
+    current_products = df.groupby("product_id")[value_columns].last().reset_index()
     current_product_dim = current_products[available_product_columns].copy()
 
     current_product_dim["record_version"] = 1
@@ -874,31 +1174,16 @@ def create_product_dimensions_full(combined_df: pd.DataFrame):
 
     # parent_sku + CATEGORY + product_cost
     if "product_name" in current_product_dim.columns:
-        current_product_dim["parent_sku"] = current_product_dim["product_name"].apply(
-            compute_parent_sku
-        )
-        current_product_dim["CATEGORY"] = current_product_dim.apply(
-            lambda r: infer_category(r.get("product_name", ""), r.get("product_id", "")),
-            axis=1,
-        )
-
-    def _calc_cost_row(row):
-        return calculate_product_cost(
-            row.get("product_name", ""),
-            row.get("CATEGORY"),
-            row.get("Price"),
-        )
+        parent_sku, category = parent_sku_and_category_series(current_product_dim)
+        current_product_dim["parent_sku"] = parent_sku
+        current_product_dim["CATEGORY"] = category
 
-    current_product_dim["product_cost"] = current_product_dim.apply(_calc_cost_row, axis=1)
+    _insert_product_cost(current_product_dim)
 
-    if "Price" in current_product_dim.columns and "product_cost" in current_product_dim.columns:
-        cols = list(current_product_dim.columns)
-        cols.remove("product_cost")
-        insert_pos = cols.index("Price") + 1
-        cols.insert(insert_pos, "product_cost")
-        current_product_dim = current_product_dim[cols]
+    return current_product_dim
 
-    # History: unique states
+def _build_history_product_dim(df: pd.DataFrame, available_product_columns: List[str]) -> pd.DataFrame:
+    """Unique (product_id, product_name, Price) states, versioned in order."""
     history_product_dim = df[available_product_columns].copy()
     if "Price" in available_product_columns:
         history_product_dim = history_product_dim.drop_duplicates(
@@ -912,35 +1197,15 @@ def create_product_dimensions_full(combined_df: pd.DataFrame):
     history_product_dim["record_version"] = (
         history_product_dim.groupby("product_id").cumcount() + 1
     )
-    history_product_dim["is_current"] = False
-
-    latest_versions = history_product_dim.groupby("product_id")["record_version"].max()
-    for product_id, max_version in latest_versions.items():
-        mask = (
-            (history_product_dim["product_id"] == product_id)
-            & (history_product_dim["record_version"] == max_version)
-        )
-        history_product_dim.loc[mask, "is_current"] = True
+    latest_versions = history_product_dim.groupby("product_id")["record_version"].transform("max")
+    history_product_dim["is_current"] = history_product_dim["record_version"] == latest_versions
 
     if "product_name" in history_product_dim.columns:
-        history_product_dim["parent_sku"] = history_product_dim["product_name"].apply(
-            compute_parent_sku
-        )
-        history_product_dim["CATEGORY"] = history_product_dim.apply(
-            lambda r: infer_category(r.get("product_name", ""), r.get("product_id", "")),
-            axis=1,
-        )
-
-    history_product_dim["product_cost"] = history_product_dim.apply(
-        _calc_cost_row, axis=1
-    )
+        parent_sku, category = parent_sku_and_category_series(history_product_dim)
+        history_product_dim["parent_sku"] = parent_sku
+        history_product_dim["CATEGORY"] = category
 
-    if "Price" in history_product_dim.columns and "product_cost" in history_product_dim.columns:
-        cols = list(history_product_dim.columns)
-        cols.remove("product_cost")
-        insert_pos = cols.index("Price") + 1
-        cols.insert(insert_pos, "product_cost")
-        history_product_dim = history_product_dim[cols]
+    _insert_product_cost(history_product_dim)
 
     if "DateTime" in history_product_dim.columns:
         history_product_dim = history_product_dim.rename(
@@ -951,12 +1216,50 @@ def create_product_dimensions_full(combined_df: pd.DataFrame):
             columns={"Date": "last_transaction_datetime"}
         )
 
+    return history_product_dim
+
+def create_product_dimensions_full(combined_df: pd.DataFrame):
+    """
+    Original behavior:
+    - Build full current_product_dimension from all data.
+    - Build history_product_dimension with one row per distinct (product_id, product_name, Price).
+    - Mark latest record_version as is_current.
+    Used when there is no existing history_product_dimension.
+    """
+    if "Product ID" not in combined_df.columns or "Product Name" not in combined_df.columns:
+        print("Warning: Required product columns (Product ID, Product Name) not found")
+        return None, None
+
+    df = combined_df.rename(columns={"Product ID": "product_id", "Product Name": "product_name"})
+
+    product_columns = ["product_id", "product_name", "Price"]
+    available_product_columns = [c for c in product_columns if c in df.columns]
+    if "DateTime" in df.columns:
+        available_product_columns.append("DateTime")
+    elif "Date" in df.columns:
+        available_product_columns.append("Date")
+
+    # The two builds only read df, so they run side by side.
+    with ThreadPoolExecutor(max_workers=2) as ex:
+        current_future = ex.submit(_build_current_product_dim, df, available_product_columns)
+        history_future = ex.submit(_build_history_product_dim, df, available_product_columns)
+        current_product_dim = current_future.result()
+        history_product_dim = history_future.result()
+
     return current_product_dim, history_product_dim
 
 # =========================
 # PRODUCT DIMENSIONS - INCREMENTAL
 # =========================
 
+def _ordered(parts: List[pd.DataFrame]):
+    """Concat row sets and restore their __pos order; None when all are empty."""
+    parts = [p for p in parts if not p.empty]
+    if not parts:
+        return None
+    frame = pd.concat(parts).sort_values("__pos", kind="stable")
+    return frame.drop(columns="__pos").reset_index(drop=True)
+
 def create_product_dimensions_incremental(combined_df: pd.DataFrame):
     """
     Incremental SCD behavior for Scenario 1:
@@ -972,8 +1275,7 @@ def create_product_dimensions_incremental(combined_df: pd.DataFrame):
         print("Warning: Missing product columns for incremental build.")
         return None, None
 
-    df = combined_df.copy()
-    df = df.rename(columns={"Product ID": "product_id", "Product Name": "product_name"})
+    df = combined_df.rename(columns={"Product ID": "product_id", "Product Name": "product_name"})
 
     if "DateTime" in combined_df.columns:
         df["DateTime"] = pd.to_datetime(df["DateTime"], errors="coerce")
@@ -997,144 +1299,82 @@ def create_product_dimensions_incremental(combined_df: pd.DataFrame):
     product_ids = batch_latest["product_id"].astype(str).unique().tolist()
     existing_hist = loader.fetch_history_for_products(product_ids)
 
-    history_rows = []
-    current_rows = []
-
-    for _, row in batch_latest.iterrows():
-        pid = str(row["product_id"])
-        pname = str(row["product_name"])
-        new_price = float(row["Price"])
-        new_datetime = row["DateTime"] if not pd.isna(row["DateTime"]) else None
-
-        existing_pid = existing_hist[existing_hist["product_id"] == pid]
-
-        # CASE 1: brand new product (no history)
-        if existing_pid.empty:
-            new_rv = 1
-            category = infer_category(pname, pid)
-            parent_sku = compute_parent_sku(pname)
-            prod_cost = calculate_product_cost(pname, category, new_price)
-
-            history_rows.append({
-                "product_id": pid,
-                "product_name": pname,
-                "price": new_price,
-                "record_version": new_rv,
-                "is_current": True,
-                "last_transaction_datetime": new_datetime,
-                "parent_sku": parent_sku,
-                "CATEGORY": category,
-                "product_cost": prod_cost,
-            })
-
-            current_rows.append({
-                "product_id": pid,
-                "product_name": pname,
-                "price": new_price,
-                "record_version": new_rv,
-                "is_current": True,
-                "last_transaction_datetime": new_datetime,
-                "parent_sku": parent_sku,
-                "CATEGORY": category,
-                "product_cost": prod_cost,
-            })
-            continue
-
-        # CASE 2: existing product (has history)
-        cur = existing_pid[existing_pid["is_current"] == True]
-        if cur.empty:
-            cur = existing_pid.loc[[existing_pid["record_version"].idxmax()]]
-        cur = cur.iloc[0]
-
-        old_price = float(cur["price"])
-        old_rv = int(cur["record_version"])
-        old_datetime = cur.get("last_transaction_datetime")
-        old_parent_sku = cur.get("parent_sku")
-        old_category = cur.get("category") or cur.get("CATEGORY")
-        old_cost = cur.get("product_cost")
-
-        # Price unchanged -> possibly update last_transaction_date
-        if new_price == old_price:
-            updated_hist = {
-                "product_id": cur["product_id"],
-                "product_name": cur["product_name"],
-                "price": old_price,
-                "record_version": old_rv,
-                "is_current": True,
-                "last_transaction_datetime": old_datetime,
-                "parent_sku": old_parent_sku,
-                "CATEGORY": old_category,
-                "product_cost": old_cost,
-            }
+    pids = pd.Series([str(v) for v in batch_latest["product_id"]])
+    pnames = pd.Series([str(v) for v in batch_latest["product_name"]])
+    new_prices = batch_latest["Price"].astype(float).reset_index(drop=True)
+    new_datetimes = batch_latest["DateTime"].reset_index(drop=True)
+
+    # Current row per product: the first is_current row, else the highest
+    # record_version. One lookup frame aligned with the batch.
+    existing_hist = existing_hist.reset_index(drop=True)
+    versions_by_pid = existing_hist.groupby("product_id", sort=False)["record_version"]
+    flagged = existing_hist[existing_hist["is_current"] == True].drop_duplicates("product_id")
+    latest = existing_hist.loc[versions_by_pid.idxmax()]
+    latest = latest[~latest["product_id"].isin(flagged["product_id"])]
+    cur = pd.concat([flagged, latest]).set_index("product_id", drop=False).reindex(pids).reset_index(drop=True)
+    max_rv = pids.map(versions_by_pid.max())
+
+    is_new = ~pids.isin(existing_hist["product_id"])
+    old_prices = cur["price"].astype(float)
+    unchanged = ~is_new & (new_prices == old_prices)
+    changed = ~is_new & ~unchanged
+    old_datetimes = pd.to_datetime(cur["last_transaction_datetime"])
+    old_categories = cur["category"].where(cur["category"].map(bool), None)
+
+    def _rows(mask, **columns):
+        frame = pd.DataFrame(columns)[mask.to_numpy()]
+        frame["__pos"] = frame.index
+        return frame
+
+    # New and repriced products get a fresh version with derived attributes
+    fresh = pd.DataFrame({"product_name": pnames, "product_id": pids, "Price": new_prices})
+    fresh_sku, fresh_category = parent_sku_and_category_series(fresh)
+    fresh["CATEGORY"] = fresh_category
+    fresh_rows = _rows(
+        ~unchanged,
+        product_id=pids,
+        product_name=pnames,
+        price=new_prices,
+        record_version=np.where(is_new, 1, max_rv.fillna(0) + 1).astype(np.int64),
+        is_current=True,
+        last_transaction_datetime=new_datetimes,
+        parent_sku=fresh_sku,
+        CATEGORY=fresh_category,
+        product_cost=calculate_product_cost_series(fresh),
+    )
 
-            if new_datetime and (not old_datetime or pd.isna(old_datetime) or new_datetime > old_datetime):
-                updated_hist["last_transaction_datetime"] = new_datetime
-
-            history_rows.append(updated_hist)
-
-            current_rows.append({
-                "product_id": pid,
-                "product_name": pname,
-                "price": old_price,
-                "record_version": old_rv,
-                "is_current": True,
-                "last_transaction_datetime": updated_hist["last_transaction_datetime"],
-                "parent_sku": old_parent_sku,
-                "CATEGORY": old_category,
-                "product_cost": old_cost,
-            })
-            continue
+    # Price unchanged -> keep the version, move last_transaction_datetime on
+    take_new = new_datetimes.notna() & (old_datetimes.isna() | (new_datetimes > old_datetimes))
+    kept = dict(
+        price=old_prices,
+        record_version=cur["record_version"].fillna(0).astype(np.int64),
+        is_current=True,
+        last_transaction_datetime=cur["last_transaction_datetime"].where(~take_new, new_datetimes),
+        parent_sku=cur["parent_sku"],
+        CATEGORY=old_categories,
+        product_cost=cur["product_cost"],
+    )
+    kept_hist = _rows(unchanged, product_id=cur["product_id"], product_name=cur["product_name"], **kept)
+    kept_current = _rows(unchanged, product_id=pids, product_name=pnames, **kept)
+
+    # Price changed -> the old current version is flagged non-current
+    retired = _rows(
+        changed,
+        product_id=cur["product_id"],
+        product_name=cur["product_name"],
+        price=old_prices,
+        record_version=kept["record_version"],
+        is_current=False,
+        last_transaction_datetime=cur["last_transaction_datetime"],
+        parent_sku=cur["parent_sku"],
+        CATEGORY=old_categories,
+        product_cost=cur["product_cost"],
+    )
 
-        # Price changed -> create new version
-        max_rv = int(existing_pid["record_version"].max())
-        new_rv = max_rv + 1
-
-        # Make sure old current is flagged non-current
-        old_cur = {
-            "product_id": cur["product_id"],
-            "product_name": cur["product_name"],
-            "price": old_price,
-            "record_version": old_rv,
-            "is_current": False,
-            "last_transaction_datetime": old_datetime,
-            "parent_sku": old_parent_sku,
-            "CATEGORY": old_category,
-            "product_cost": old_cost,
-        }
-        history_rows.append(old_cur)
-
-        # New current version
-        category = infer_category(pname, pid)
-        parent_sku = compute_parent_sku(pname)
-        prod_cost = calculate_product_cost(pname, category, new_price)
-
-        new_hist = {
-            "product_id": pid,
-            "product_name": pname,
-            "price": new_price,
-            "record_version": new_rv,
-            "is_current": True,
-            "last_transaction_datetime": new_datetime,
-            "parent_sku": parent_sku,
-            "CATEGORY": category,
-            "product_cost": prod_cost,
-        }
-        history_rows.append(new_hist)
-
-        current_rows.append({
-            "product_id": pid,
-            "product_name": pname,
-            "price": new_price,
-            "record_version": new_rv,
-            "is_current": True,
-            "last_transaction_datetime": new_datetime,
-            "parent_sku": parent_sku,
-            "CATEGORY": category,
-            "product_cost": prod_cost,
-        })
-
-    history_product_dim = pd.DataFrame(history_rows) if history_rows else None
-    current_product_dim = pd.DataFrame(current_rows) if current_rows else None
+    # Batch order, with a retired version just ahead of its replacement
+    retired["__pos"] = retired["__pos"] - 0.5
+    history_product_dim = _ordered([retired, kept_hist, fresh_rows])
+    current_product_dim = _ordered([kept_current, fresh_rows])
 
     return current_product_dim, history_product_dim
 
@@ -1155,6 +1395,47 @@ def _df_timestamps_to_iso_etl(df: pd.DataFrame, cols: List[str]) -> pd.DataFrame
             df[c] = pd.to_datetime(df[c], errors="coerce").dt.strftime('%Y-%m-%d %H:%M:%S')
     return df
 
+def time_to_id(time_str):
+    try:
+        s = str(time_str).strip()
+        if ":" in s:
+            h, m = s.split(":", 1)
+        elif len(s) == 4 and s.isdigit():
+            h, m = s[:2], s[2:]
+        else:
+            return None
+        return f"H{int(h):02}M{int(m):02}"
+    except Exception:
+        return None
+
+def time_ids_series(times: pd.Series) -> pd.Series:
+    """
+    time_to_id over a column. Times of day repeat heavily, so each distinct
+    value is parsed once and broadcast back by factorize code (missing values
+    map to the trailing slot).
+    """
+    codes, uniques = pd.factorize(times)
+    ids = np.array([time_to_id(u) for u in uniques] + [time_to_id(np.nan)], dtype=object)
+    return pd.Series(ids[codes], index=times.index)
+
+def _join_by_group(keys: pd.Series, values: pd.Series, sep: str = ",") -> pd.Series:
+    """
+    groupby(keys)[values].apply(sep.join) without a Python call per group:
+    keys are factorized to sorted integer codes (the groupby's group
+    numbers), values are put in code order once (stable, so row order holds
+    inside a group) and joined slice by slice. Indexed by the sorted keys.
+    """
+    codes, uniques = pd.factorize(keys, sort=True)
+    # groupby infers the key index dtype (e.g. int64 for object-held ints)
+    index = uniques.infer_objects().rename(keys.name)
+    if index.empty:
+        return pd.Series([], index=index, dtype=str)
+    keep = codes >= 0
+    order = np.argsort(codes[keep], kind="stable")
+    ordered = values.astype(str).to_numpy(dtype=object)[keep][order].tolist()
+    ends = np.cumsum(np.bincount(codes[keep], minlength=len(index))).tolist()
+    return pd.Series([sep.join(ordered[s:e]) for s, e in zip([0] + ends[:-1], ends)], index=index)
+
 def load(combined_df: pd.DataFrame):
     print("=== LOAD PHASE (buffer → COPY → UPSERT) ===")
 
@@ -1180,21 +1461,8 @@ def load(combined_df: pd.DataFrame):
     history_snake = _df_timestamps_to_iso_etl(history_snake, ["last_transaction_datetime"])
 
     # ---------- 3) Prepare fact + transaction_records ----------
-    def time_to_id(time_str):
-        try:
-            s = str(time_str).strip()
-            if ":" in s:
-                h, m = s.split(":", 1)
-            elif len(s) == 4 and s.isdigit():
-                h, m = s[:2], s[2:]
-            else:
-                return None
-            return f"H{int(h):02}M{int(m):02}"
-        except Exception:
-            return None
-
     if "Time" in combined_df.columns:
-        combined_df["time_id"] = combined_df["Time"].apply(time_to_id)
+        combined_df["time_id"] = time_ids_series(combined_df["Time"])
     else:
         combined_df["time_id"] = None
 
@@ -1210,7 +1478,16 @@ def load(combined_df: pd.DataFrame):
         combined_df = combined_df.drop(columns=["Time"])
 
     combined_df = combined_df[final_cols]
-    combined_df = combined_df.drop_duplicates().reset_index(drop=True)
+    # Full-row dedup, but only rows sharing a natural key can be duplicates,
+    # so compare every column just for those.
+    natural_key = [c for c in ["Receipt No", "Date", "Product ID", "time_id"] if c in combined_df.columns]
+    if natural_key:
+        candidates = combined_df.duplicated(subset=natural_key, keep=False)
+        duplicate = pd.Series(False, index=combined_df.index)
+        duplicate[candidates] = combined_df[candidates].duplicated()
+        combined_df = combined_df[~duplicate].reset_index(drop=True)
+    else:
+        combined_df = combined_df.drop_duplicates().reset_index(drop=True)
 
     # fact_transaction_dimension: exclude latest month
     if "Date" in combined_df.columns:
@@ -1227,12 +1504,10 @@ def load(combined_df: pd.DataFrame):
 
     txn_df = pd.DataFrame()
     if "Receipt No" in combined_df.columns and "Product ID" in combined_df.columns:
-        tmp = combined_df.copy()
+        tmp = combined_df[["Receipt No", "Product ID"]]
         tmp["Product ID"] = tmp["Product ID"].astype(str)
         tmp["__parent_sku"] = tmp["Product ID"].map(parent_map).fillna(tmp["Product ID"])
-        txn_df = (
-            tmp.groupby("Receipt No")["__parent_sku"].apply(lambda x: ",".join(x.astype(str))).reset_index(name="SKU")
-        )
+        txn_df = _join_by_group(tmp["Receipt No"], tmp["__parent_sku"]).reset_index(name="SKU")
 
     # snake_case + ISO dates
     fact_snake = rename_columns_snake_case(fact_df)
@@ -1243,72 +1518,42 @@ def load(combined_df: pd.DataFrame):
     run_id = time.strftime("%Y%m%d_%H%M%S")
     run_prefix = f"{settings.minio_etl_folder}/{run_id}/"
 
-    def _to_csv_bytes(df: pd.DataFrame) -> bytes:
-        return df.to_csv(index=False).encode("utf-8")
-
-    # Deduplicate all DataFrames based on their primary keys
-    if not time_dim_snake.empty:
-        time_dim_snake = time_dim_snake.drop_duplicates(subset=["time_id"], keep="last")
-    if not current_snake.empty:
-        current_snake = current_snake.drop_duplicates(subset=["product_id"], keep="last")
-    if not history_snake.empty:
-        history_snake = history_snake.drop_duplicates(subset=["product_id", "record_version"], keep="last")
-    if not txn_snake.empty:
-        txn_snake = txn_snake.drop_duplicates(subset=["receipt_no"], keep="last")
-    if not fact_snake.empty:
-        fact_snake = fact_snake.drop_duplicates(subset=["receipt_no", "date", "product_id"], keep="last")
+    def _to_csv_buffer(df: pd.DataFrame) -> io.BytesIO:
+        # to_csv encodes and compresses chunk by chunk into the buffer, which
+        # is then uploaded as-is: no whole-CSV str and no bytes copy.
+        buf = io.BytesIO()
+        df.to_csv(buf, index=False, encoding="utf-8", compression=STAGING_COMPRESSION)
+        return buf
+
+    # (table, frame, primary key) for every artifact; each is deduplicated on
+    # its key, serialized and uploaded on its own worker. The upserts below
+    # stay sequential for FK order.
+    staged_tables = [
+        ("time_dimension", time_dim_snake, ["time_id"]),
+        ("current_product_dimension", current_snake, ["product_id"]),
+        ("history_product_dimension", history_snake, ["product_id", "record_version"]),
+        ("transaction_records", txn_snake, ["receipt_no"]),
+        ("fact_transaction_dimension", fact_snake, ["receipt_no", "date", "product_id"]),
+    ]
+    staged_tables = [t for t in staged_tables if not t[1].empty]
+
+    def _stage(table: str, frame: pd.DataFrame, key_columns: List[str]) -> dict:
+        frame = frame.drop_duplicates(subset=key_columns, keep="last")
+        filename = f"{table}.csv.gz"
+        _staging_put_buffer_etl(run_prefix + filename, _to_csv_buffer(frame), STAGING_CONTENT_TYPE)
+        return {
+            "table": table,
+            "filename": filename,
+            "columns": list(frame.columns),
+            "key_columns": key_columns,
+        }
 
     artifacts = []
-
-    if not time_dim_snake.empty:
-        time_cols = list(time_dim_snake.columns)
-        _staging_put_bytes_etl(run_prefix + "time_dimension.csv", _to_csv_bytes(time_dim_snake))
-        artifacts.append({
-            "table": "time_dimension",
-            "filename": "time_dimension.csv",
-            "columns": time_cols,
-            "key_columns": ["time_id"]
-        })
-
-    if not current_snake.empty:
-        prod_cols = list(current_snake.columns)
-        _staging_put_bytes_etl(run_prefix + "current_product_dimension.csv", _to_csv_bytes(current_snake))
-        artifacts.append({
-            "table": "current_product_dimension",
-            "filename": "current_product_dimension.csv",
-            "columns": prod_cols,
-            "key_columns": ["product_id"]
-        })
-
-    if not history_snake.empty:
-        hist_cols = list(history_snake.columns)
-        _staging_put_bytes_etl(run_prefix + "history_product_dimension.csv", _to_csv_bytes(history_snake))
-        artifacts.append({
-            "table": "history_product_dimension",
-            "filename": "history_product_dimension.csv",
-            "columns": hist_cols,
-            "key_columns": ["product_id", "record_version"]
-        })
-
-    if not txn_snake.empty:
-        txn_cols = list(txn_snake.columns)
-        _staging_put_bytes_etl(run_prefix + "transaction_records.csv", _to_csv_bytes(txn_snake))
-        artifacts.append({
-            "table": "transaction_records",
-            "filename": "transaction_records.csv",
-            "columns": txn_cols,
-            "key_columns": ["receipt_no"]
-        })
-
-    if not fact_snake.empty:
-        fact_cols = list(fact_snake.columns)
-        _staging_put_bytes_etl(run_prefix + "fact_transaction_dimension.csv", _to_csv_bytes(fact_snake))
-        artifacts.append({
-            "table": "fact_transaction_dimension",
-            "filename": "fact_transaction_dimension.csv",
-            "columns": fact_cols,
-            "key_columns": ["receipt_no", "date", "product_id"]
-        })
+    if staged_tables:
+        # Create the bucket up front so the workers don't race to make it.
+        _ensure_staging_bucket_for_etl()
+        with ThreadPoolExecutor(max_workers=len(staged_tables)) as ex:
+            artifacts = list(ex.map(lambda t: _stage(*t), staged_tables))
 
     # Load in strict sequence with UPSERT
     order = ["time_dimension", "current_product_dimension", "history_product_dimension", "transaction_records", "fact_transaction_dimension"]
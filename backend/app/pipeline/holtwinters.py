@@ -2,8 +2,6 @@ import os
 import sys
 import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
-from statsmodels.tsa.holtwinters import ExponentialSmoothing
 
 # =========================
 # USER CONFIGURATION
@@ -23,44 +21,125 @@ HW_GAMMA = 0.2
 # Price scenario (fallback)
 DISCOUNT_RATE = 0.05
 
+# Fact columns the rules loop reads; the rest of the table is never fetched
+FACT_COLUMNS = ['date', 'receipt_no', 'product_id', 'line_total']
+
 # =========================
 # HELPER FUNCTIONS
 # =========================
-def resolve_ids(product_df: pd.DataFrame, name_a: str, name_b: str) -> tuple[str, str]:
-    a = product_df.loc[product_df['product_name'] == name_a]
-    b = product_df.loc[product_df['product_name'] == name_b]
-    if a.empty or b.empty:
+def resolve_ids(id_by_name: dict, name_a: str, name_b: str) -> tuple[str, str]:
+    a = id_by_name.get(name_a)
+    b = id_by_name.get(name_b)
+    if a is None or b is None:
         raise ValueError(f"Could not find product IDs for '{name_a}' or '{name_b}'.")
-    return str(a['product_id'].iloc[0]), str(b['product_id'].iloc[0])
+    return a, b
 
 def pick_ped_row(ped_df: pd.DataFrame, id_a: str, id_b: str) -> pd.Series | None:
     a, b = str(id_a), str(id_b)
-    m1 = (ped_df['product_id_1'].astype(str) == a) & (ped_df['product_id_2'].astype(str) == b)
-    m2 = (ped_df['product_id_1'].astype(str) == b) & (ped_df['product_id_2'].astype(str) == a)
+    m1 = (ped_df['product_id_1'] == a) & (ped_df['product_id_2'] == b)
+    m2 = (ped_df['product_id_1'] == b) & (ped_df['product_id_2'] == a)
     matches = ped_df[m1 | m2].copy()
     if matches.empty:
         return None
-    non_strict = matches[matches['mode'].astype(str).str.lower() == 'non_strict']
+    non_strict = matches[matches['mode'].str.lower() == 'non_strict']
     if not non_strict.empty:
         return non_strict.iloc[0]
     return matches.iloc[0]
 
+def initial_states_simple(y: np.ndarray, m: int) -> tuple[float, float, np.ndarray]:
+    """
+    Additive level, trend and seasonals from the first two seasonal cycles
+    (Hyndman & Athanasopoulos, FPP3 section 7.6). Port of statsmodels'
+    private _initialization_simple for trend='add', seasonal='add'.
+    """
+    if len(y) < 2 * m:
+        raise ValueError("Cannot compute initial seasonals using"
+                         " heuristic method with less than two full"
+                         " seasonal cycles in the data.")
+    initial_level = np.mean(y[:m])
+    initial_trend = (pd.Series(y).diff(m)[m:2 * m] / m).mean()
+    initial_seasons = y[:m] - initial_level
+    return initial_level, initial_trend, initial_seasons
+
+def initial_states_heuristic(y: np.ndarray, m: int) -> tuple[float, float, np.ndarray]:
+    """
+    Additive level, trend and seasonals from a centred moving average and a
+    line fitted to its first 10 points (Hyndman et al., section 2.6). Port of
+    statsmodels' private _initialization_heuristic for trend='add',
+    seasonal='add'.
+    """
+    nobs = len(y)
+    min_obs = 10 + 2 * (m // 2)
+    if nobs < max(2 * m, min_obs):
+        raise ValueError("Cannot use heuristic method to compute initial"
+                         " seasonal and levels with less than"
+                         " max(2 * seasonal_periods, 10 + 2 * (seasonal_periods // 2))"
+                         " datapoints.")
+    k_cycles = max(min(5, nobs // m), int(np.ceil(min_obs / m)))
+
+    # Centred moving average over the first k_cycles cycles
+    series = pd.Series(y[:m * k_cycles])
+    trend = series.rolling(m, center=True).mean()
+    if m % 2 == 0:
+        trend = trend.shift(-1).rolling(2).mean()
+
+    # Average detrended value per season, normalized to sum to zero
+    detrended = series - trend
+    tmp = np.zeros(k_cycles * m) * np.nan
+    tmp[:len(detrended)] = detrended.values
+    initial_seasons = np.nanmean(tmp.reshape(k_cycles, m).T, axis=1)
+    initial_seasons -= np.mean(initial_seasons)
+
+    # Level and trend from a straight line through the first 10 trend points
+    exog = np.c_[np.ones(10), np.arange(10) + 1]
+    beta = np.squeeze(np.linalg.pinv(exog).dot(np.atleast_2d(trend.dropna().values).T[:10]))
+    return beta[0], beta[1], initial_seasons
+
+def additive_hw_forecast(y: np.ndarray, h: int) -> np.ndarray:
+    """
+    h-step forecast of additive-trend, additive-seasonal Holt-Winters with the
+    fixed HW_ALPHA / HW_BETA / HW_GAMMA. Same initial values, recursions and
+    forecast layout as statsmodels' fit(optimized=False), minus the model and
+    results objects built around them on every call.
+    """
+    alpha, beta, gamma, m = HW_ALPHA, HW_BETA, HW_GAMMA, SEASONAL_PERIODS
+    nobs = len(y)
+    if nobs < 10 + 2 * (m // 2):
+        initial_level, initial_trend, initial_seasons = initial_states_simple(y, m)
+    else:
+        initial_level, initial_trend, initial_seasons = initial_states_heuristic(y, m)
+
+    y_alpha = alpha * y
+    y_gamma = gamma * y
+    lvls = np.zeros(nobs + h + 1)
+    b = np.zeros(nobs + h + 1)
+    s = np.zeros(nobs + h + m + 1)
+    lvls[0] = initial_level
+    b[0] = initial_trend
+    s[:m] = initial_seasons
+    for i in range(1, nobs + 1):
+        lvls[i] = y_alpha[i - 1] - (alpha * s[i - 1]) + ((1 - alpha) * (lvls[i - 1] + b[i - 1]))
+        b[i] = (beta * (lvls[i] - lvls[i - 1])) + ((1 - beta) * b[i - 1])
+        s[i + m - 1] = y_gamma[i - 1] - (gamma * (lvls[i - 1] + b[i - 1])) + ((1 - gamma) * s[i - 1])
+
+    lvls[nobs:] = lvls[nobs]
+    b[nobs:] = b[nobs] * np.arange(1, h + 2)
+    s[nobs + m - 1:] = [s[(nobs - 1) + j % m] for j in range(h + 2)]
+    return (lvls + b + s[:-m])[nobs:nobs + h]
+
 def fit_and_forecast_to_index(series: pd.Series, label: str, idx: pd.DatetimeIndex) -> pd.Series:
     if series is None or series.empty:
         return pd.Series(0.0, index=idx)
+    if not OPTIMIZED:
+        fc = additive_hw_forecast(np.asarray(series, dtype=float), len(idx))
+        return pd.Series(fc, index=idx)
+    # Only the optimized fit needs the full model; importing it costs ~1s
+    from statsmodels.tsa.holtwinters import ExponentialSmoothing
     model = ExponentialSmoothing(
         series, trend='add', seasonal='add',
         seasonal_periods=SEASONAL_PERIODS, initialization_method="estimated"
     )
-    if OPTIMIZED:
-        fitted = model.fit(optimized=True)
-    else:
-        fitted = model.fit(
-            smoothing_level=HW_ALPHA,
-            smoothing_trend=HW_BETA,
-            smoothing_seasonal=HW_GAMMA,
-            optimized=False
-        )
+    fitted = model.fit(optimized=True)
     fc = fitted.forecast(len(idx))
     fc.index = idx
     return fc
@@ -68,14 +147,172 @@ def fit_and_forecast_to_index(series: pd.Series, label: str, idx: pd.DatetimeInd
 def build_ts_all(lines: pd.DataFrame, AGG_FREQ: str) -> pd.Series:
     if lines.empty:
         return pd.Series(dtype=float)
-    rec = lines.groupby('Receipt No').agg(Date=('Date', 'first'))
+    # One row per receipt with its first non-null Date, as groupby().first()
+    # gives: a stable sort moves null dates behind the rest before the dedup.
+    rec = (
+        lines[['Receipt No', 'Date']]
+        .dropna(subset=['Receipt No'])
+        .sort_values('Date', key=lambda d: d.isna(), kind='stable')
+        .drop_duplicates('Receipt No')
+    )
     rec['Date'] = pd.to_datetime(rec['Date'], errors='coerce')
     return rec.groupby(pd.Grouper(key='Date', freq=AGG_FREQ)).size()
 
+def last_index_or_min(ts: pd.Series):
+    return ts.index[-1] if (ts is not None and not ts.empty) else pd.Timestamp.min
+
+def forecast_step(freq: str):
+    if freq.upper().startswith('Q'):
+        return pd.offsets.QuarterEnd()
+    elif freq.upper().startswith('M'):
+        return pd.offsets.MonthEnd()
+    return pd.tseries.frequencies.to_offset(freq)
+
+# =========================
+# RULES LOOP
+# =========================
+def ts_all_for(ctx: dict, pid: str) -> tuple[pd.Series, pd.Timestamp]:
+    """A product's per-period series and last period, built once per run."""
+    cache = ctx['ts_all_by_pid']
+    if pid not in cache:
+        ts = build_ts_all(ctx['lines_by_pid'].get(pid, ctx['no_lines']), AGG_FREQ)
+        cache[pid] = (ts, last_index_or_min(ts))
+    return cache[pid]
+
+def process_rule(ctx: dict, idx, rule: dict) -> pd.DataFrame | None:
+    """
+    Forecast one bundle rule with the per-run lookups in ctx. Returns its
+    result frame, or None when the rule is skipped or fails.
+    """
+    try:
+        product_a_name = str(rule['antecedents_names'])
+        product_b_name = str(rule['consequents_names'])
+        bundle_id = rule.get('bundle_id', "")
+        category  = rule.get('category', "")
+
+        print(f"\n==============================")
+        print(f"Processing bundle row {idx}: {product_a_name} + {product_b_name}")
+        print(f"Bundle ID: {bundle_id}")
+        print(f"==============================")
+
+        product_a_id, product_b_id = resolve_ids(ctx['id_by_name'], product_a_name, product_b_name)
+
+        ped_row = pick_ped_row(ctx['ped_df'], product_a_id, product_b_id)
+        if ped_row is None:
+            print(f" Skipping {product_a_name} + {product_b_name}: No PED match.")
+            return None
+
+        epsilon   = float(ped_row.get('elasticity_epsilon', 0.0) or 0.0)
+        intercept = float(ped_row.get('intercept_logk', 0.0) or 0.0)
+        n_points  = int(ped_row.get('n_price_points', 0) or 0)
+
+        receipts_with_both = (
+            ctx['receipts_by_pid'].get(product_a_id, set()) & ctx['receipts_by_pid'].get(product_b_id, set())
+        )
+        receipt_summary = ctx['receipt_totals'][ctx['receipt_totals'].index.isin(list(receipts_with_both))].copy()
+        receipt_summary['Date'] = pd.to_datetime(receipt_summary['Date'], errors='coerce')
+        bundle_sales_ts = receipt_summary.groupby(pd.Grouper(key='Date', freq=AGG_FREQ)).size()
+
+        a_ts_all, a_last = ts_all_for(ctx, product_a_id)
+        b_ts_all, b_last = ts_all_for(ctx, product_b_id)
+
+        if bundle_sales_ts.empty and (a_ts_all.empty and b_ts_all.empty):
+            print(" No sales data found. Skipping.")
+            return None
+
+        current_price_a = float(ctx['price_by_pid'][product_a_id])
+        current_price_b = float(ctx['price_by_pid'][product_b_id])
+        current_price = current_price_a + current_price_b
+
+        recommended_price = None
+        if bundle_id and bundle_id in ctx['nlp_opt_indexed'].index:
+            try:
+                recommended_price = float(ctx['nlp_opt_indexed'].loc[bundle_id, 'bundle_price_recommended'])
+            except KeyError:
+                recommended_price = None
+
+        if recommended_price is not None and not np.isnan(recommended_price):
+            new_price = recommended_price
+        else:
+            new_price = current_price * (1 - DISCOUNT_RATE)
+
+        price_ratio = new_price / current_price if current_price > 0 else 1.0
+        demand_multiplier = price_ratio ** epsilon if current_price > 0 else 1.0
+
+        latest_actual = max([last_index_or_min(bundle_sales_ts), a_last, b_last])
+        COMMON_FC_INDEX = pd.date_range(start=latest_actual + ctx['step'], periods=HORIZON, freq=AGG_FREQ)
+
+        bundle_fc_raw = fit_and_forecast_to_index(bundle_sales_ts, "Bundle", COMMON_FC_INDEX)
+        a_fc_all_raw = fit_and_forecast_to_index(a_ts_all, f"{product_a_name}", COMMON_FC_INDEX)
+        b_fc_all_raw = fit_and_forecast_to_index(b_ts_all, f"{product_b_name}", COMMON_FC_INDEX)
+
+        bundle_fc = bundle_fc_raw.clip(lower=0)
+        bundle_fc_adj = (bundle_fc_raw * demand_multiplier).clip(lower=0)
+        a_fc_all = a_fc_all_raw.clip(lower=0)
+        b_fc_all = b_fc_all_raw.clip(lower=0)
+
+        cannibalization_units = bundle_fc
+        a_fc_after_aligned = (a_fc_all - cannibalization_units).clip(lower=0)
+        b_fc_after_aligned = (b_fc_all - cannibalization_units).clip(lower=0)
+
+        def revenue_forecast(series, price):
+            return series * price
+
+        price_a, price_b = current_price_a, current_price_b
+
+        rev_a_before = revenue_forecast(a_fc_all, price_a)
+        rev_b_before = revenue_forecast(b_fc_all, price_b)
+        rev_a_after  = revenue_forecast(a_fc_after_aligned, price_a)
+        rev_b_after  = revenue_forecast(b_fc_after_aligned, price_b)
+        rev_bundle_after = bundle_fc_adj * new_price
+
+        overall_before = rev_a_before.sum() + rev_b_before.sum()
+        overall_after  = rev_a_after.sum() + rev_b_after.sum() + rev_bundle_after.sum()
+        impact_abs = overall_after - overall_before
+        impact_pct = (impact_abs / overall_before * 100.0) if overall_before != 0 else np.nan
+
+        # Every period any history series has, then the forecast periods (all
+        # later), as one frame; each series fills its own rows, NaN elsewhere.
+        history_index = COMMON_FC_INDEX[:0]
+        for ts in (bundle_sales_ts, a_ts_all, b_ts_all):
+            if not ts.empty:
+                history_index = history_index.union(ts.index)
+        df_all = pd.DataFrame({
+            'Bundle_Units': bundle_sales_ts,
+            'Antecedent_Units': a_ts_all,
+            'Consequent_Units': b_ts_all,
+            'Bundle_Units_Forecast': bundle_fc,
+            'Bundle_Units_Adjusted_Forecast': bundle_fc_adj,
+            'Antecedent_Units_Forecast': a_fc_all,
+            'Antecedent_Units_After_Cannibalization': a_fc_after_aligned,
+            'Consequent_Units_Forecast': b_fc_all,
+            'Consequent_Units_After_Cannibalization': b_fc_after_aligned
+        }, index=history_index.append(COMMON_FC_INDEX), dtype=float)
+        df_all.index.name = 'Date'
+        df_all['bundle_row'] = idx
+        df_all['bundle_id'] = bundle_id
+        df_all['category']  = category
+
+        print(
+            f"Original Price: {current_price:.2f} | "
+            f"Recommended Price: {new_price:.2f} | "
+            f"Impact: {impact_abs:.2f} ({impact_pct:.1f}%)"
+        )
+        return df_all
+
+    except Exception as e:
+        print(f" Error in row {idx}: {e}")
+        return None
+
 # =========================
 # MAIN
 # =========================
-def main():
+def main(fact_df: pd.DataFrame | None = None, product_df: pd.DataFrame | None = None):
+    """
+    fact_df / product_df: fact_transaction_dimension (FACT_COLUMNS) and
+    current_product_dimension as exported, when the caller (run_all) already
+    has them; loaded here otherwise. They are never modified in place.
+    """
     # Import loader
     from . import loader
     import time
@@ -84,8 +321,10 @@ def main():
     print("Loading data from PostgreSQL...")
     try:
         rules_df   = loader.export_table_to_csv('association_rules')
-        fact_df    = loader.export_table_to_csv('fact_transaction_dimension')
-        product_df = loader.export_table_to_csv('current_product_dimension')
+        if fact_df is None:
+            fact_df = loader.export_table_to_csv('fact_transaction_dimension', FACT_COLUMNS)
+        if product_df is None:
+            product_df = loader.export_table_to_csv('current_product_dimension')
         ped_df     = loader.export_table_to_csv('ped_summary')
         nlp_opt_df = loader.export_table_to_csv('nlp_optimization_results')
     except Exception as e:
@@ -94,8 +333,8 @@ def main():
 
     # Normalize column names
     rules_df.columns = [c.lower() for c in rules_df.columns]
-    fact_df.columns = [c.title().replace('_', ' ') for c in fact_df.columns]
-    product_df.columns = [c.lower() for c in product_df.columns]
+    fact_df = fact_df.rename(columns=lambda c: c.title().replace('_', ' '))
+    product_df = product_df.rename(columns=str.lower)
     ped_df.columns = [c.lower() for c in ped_df.columns]
     nlp_opt_df.columns = [c.lower() for c in nlp_opt_df.columns]
     
@@ -103,158 +342,56 @@ def main():
     fact_df = fact_df.rename(columns={'Product Id': 'Product ID'})
     product_df = product_df.rename(columns={'price': 'Price'})
 
+    # pick_ped_row compares these as strings for every rule; cast them once.
+    for col in ('product_id_1', 'product_id_2', 'mode'):
+        ped_df[col] = ped_df[col].astype(str)
+
     all_results = []
     nlp_opt_indexed = nlp_opt_df.set_index('bundle_id')
 
+    # Per-product and per-receipt views of the fact table, built once so each
+    # rule is a few dict lookups instead of several full-table scans.
+    fact_pids = fact_df['Product ID'].astype(str)
+    lines_by_pid = {pid: lines for pid, lines in fact_df.groupby(fact_pids, sort=False)}
+    receipts_by_pid = {
+        pid: set(receipts.dropna().unique())
+        for pid, receipts in fact_df['Receipt No'].groupby(fact_pids, sort=False)
+    }
+    receipt_totals = fact_df.groupby('Receipt No').agg(
+        Combined_Price=('Line Total', 'sum'),
+        Date=('Date', 'first')
+    )
+    # First product_id per name, matching the old first-row lookup.
+    first_by_name = product_df.drop_duplicates('product_name')
+    id_by_name = dict(zip(first_by_name['product_name'], first_by_name['product_id'].astype(str)))
+    price_by_pid = (
+        product_df.assign(product_id=product_df['product_id'].astype(str))
+        .drop_duplicates('product_id')
+        .set_index('product_id')['Price']
+        .to_dict()
+    )
+    no_lines = fact_df.iloc[0:0]
+
     # =========================
     # LOOP THROUGH ALL BUNDLE ROWS
     # =========================
-    for idx, rule_row in rules_df.iterrows():
-        try:
-            product_a_name = str(rule_row['antecedents_names'])
-            product_b_name = str(rule_row['consequents_names'])
-            bundle_id = rule_row['bundle_id'] if 'bundle_id' in rule_row else ""
-            category  = rule_row['category'] if 'category' in rule_row else ""
-
-            print(f"\n==============================")
-            print(f"Processing bundle row {idx}: {product_a_name} + {product_b_name}")
-            print(f"Bundle ID: {bundle_id}")
-            print(f"==============================")
-
-            product_a_id, product_b_id = resolve_ids(product_df, product_a_name, product_b_name)
-
-            ped_row = pick_ped_row(ped_df, product_a_id, product_b_id)
-            if ped_row is None:
-                print(f" Skipping {product_a_name} + {product_b_name}: No PED match.")
-                continue
-
-            epsilon   = float(ped_row.get('elasticity_epsilon', 0.0) or 0.0)
-            intercept = float(ped_row.get('intercept_logk', 0.0) or 0.0)
-            n_points  = int(ped_row.get('n_price_points', 0) or 0)
-
-            pair_transactions = fact_df[fact_df['Product ID'].astype(str).isin([product_a_id, product_b_id])]
-            receipt_products = pair_transactions.groupby('Receipt No')['Product ID'].apply(lambda s: set(s.astype(str)))
-            receipts_with_both = receipt_products[
-                receipt_products.apply(lambda s: (product_a_id in s) and (product_b_id in s))
-            ].index
-
-            working_df = fact_df[fact_df['Receipt No'].isin(receipts_with_both)]
-            receipt_summary = working_df.groupby('Receipt No').agg(
-                Combined_Price=('Line Total', 'sum'),
-                Date=('Date', 'first')
-            )
-            receipt_summary['Date'] = pd.to_datetime(receipt_summary['Date'], errors='coerce')
-            bundle_sales_ts = receipt_summary.groupby(pd.Grouper(key='Date', freq=AGG_FREQ)).size()
-
-            a_lines_all = fact_df[fact_df['Product ID'].astype(str) == str(product_a_id)]
-            b_lines_all = fact_df[fact_df['Product ID'].astype(str) == str(product_b_id)]
-            a_ts_all = build_ts_all(a_lines_all, AGG_FREQ)
-            b_ts_all = build_ts_all(b_lines_all, AGG_FREQ)
-
-            if bundle_sales_ts.empty and (a_ts_all.empty and b_ts_all.empty):
-                print(" No sales data found. Skipping.")
-                continue
-
-            current_price_a = float(
-                product_df.loc[product_df['product_id'].astype(str) == str(product_a_id), 'Price'].iloc[0]
-            )
-            current_price_b = float(
-                product_df.loc[product_df['product_id'].astype(str) == str(product_b_id), 'Price'].iloc[0]
-            )
-            current_price = current_price_a + current_price_b
-
-            recommended_price = None
-            if bundle_id and bundle_id in nlp_opt_indexed.index:
-                try:
-                    recommended_price = float(nlp_opt_indexed.loc[bundle_id, 'bundle_price_recommended'])
-                except KeyError:
-                    recommended_price = None
-
-            if recommended_price is not None and not np.isnan(recommended_price):
-                new_price = recommended_price
-            else:
-                new_price = current_price * (1 - DISCOUNT_RATE)
-
-            price_ratio = new_price / current_price if current_price > 0 else 1.0
-            demand_multiplier = price_ratio ** epsilon if current_price > 0 else 1.0
-
-            if AGG_FREQ.upper().startswith('Q'):
-                step = pd.offsets.QuarterEnd()
-            elif AGG_FREQ.upper().startswith('M'):
-                step = pd.offsets.MonthEnd()
-            else:
-                step = pd.tseries.frequencies.to_offset(AGG_FREQ)
-
-            def last_index_or_min(ts: pd.Series):
-                return ts.index[-1] if (ts is not None and not ts.empty) else pd.Timestamp.min
-
-            latest_actual = max([
-                last_index_or_min(bundle_sales_ts),
-                last_index_or_min(a_ts_all),
-                last_index_or_min(b_ts_all)
-            ])
-            COMMON_FC_INDEX = pd.date_range(start=latest_actual + step, periods=HORIZON, freq=AGG_FREQ)
-
-            bundle_fc_raw = fit_and_forecast_to_index(bundle_sales_ts, "Bundle", COMMON_FC_INDEX)
-            a_fc_all_raw = fit_and_forecast_to_index(a_ts_all, f"{product_a_name}", COMMON_FC_INDEX)
-            b_fc_all_raw = fit_and_forecast_to_index(b_ts_all, f"{product_b_name}", COMMON_FC_INDEX)
-
-            bundle_fc = bundle_fc_raw.clip(lower=0)
-            bundle_fc_adj = (bundle_fc_raw * demand_multiplier).clip(lower=0)
-            a_fc_all = a_fc_all_raw.clip(lower=0)
-            b_fc_all = b_fc_all_raw.clip(lower=0)
-
-            cannibalization_units = bundle_fc
-            a_fc_after_aligned = (a_fc_all - cannibalization_units).clip(lower=0)
-            b_fc_after_aligned = (b_fc_all - cannibalization_units).clip(lower=0)
-
-            def revenue_forecast(series, price):
-                return series * price
-
-            price_a, price_b = current_price_a, current_price_b
-
-            rev_a_before = revenue_forecast(a_fc_all, price_a)
-            rev_b_before = revenue_forecast(b_fc_all, price_b)
-            rev_a_after  = revenue_forecast(a_fc_after_aligned, price_a)
-            rev_b_after  = revenue_forecast(b_fc_after_aligned, price_b)
-            rev_bundle_after = bundle_fc_adj * new_price
-
-            overall_before = rev_a_before.sum() + rev_b_before.sum()
-            overall_after  = rev_a_after.sum() + rev_b_after.sum() + rev_bundle_after.sum()
-            impact_abs = overall_after - overall_before
-            impact_pct = (impact_abs / overall_before * 100.0) if overall_before != 0 else np.nan
-
-            df_points = pd.DataFrame({
-                'Bundle_Units': bundle_sales_ts,
-                'Antecedent_Units': a_ts_all,
-                'Consequent_Units': b_ts_all
-            })
-            df_forecast = pd.DataFrame({
-                'Bundle_Units_Forecast': bundle_fc,
-                'Bundle_Units_Adjusted_Forecast': bundle_fc_adj,
-                'Antecedent_Units_Forecast': a_fc_all,
-                'Antecedent_Units_After_Cannibalization': a_fc_after_aligned,
-                'Consequent_Units_Forecast': b_fc_all,
-                'Consequent_Units_After_Cannibalization': b_fc_after_aligned
-            })
-            df_all = pd.concat([df_points, df_forecast], axis=0)
-            df_all.index.name = 'Date'
-            df_all['bundle_row'] = idx
-            df_all['bundle_id'] = bundle_id
-            df_all['category']  = category
-
+    ctx = {
+        'id_by_name': id_by_name,
+        'ped_df': ped_df,
+        'receipts_by_pid': receipts_by_pid,
+        'receipt_totals': receipt_totals,
+        'price_by_pid': price_by_pid,
+        'nlp_opt_indexed': nlp_opt_indexed,
+        'lines_by_pid': lines_by_pid,
+        'no_lines': no_lines,
+        'step': forecast_step(AGG_FREQ),
+        'ts_all_by_pid': {},
+    }
+    for idx, rule in zip(rules_df.index, rules_df.to_dict('records')):
+        df_all = process_rule(ctx, idx, rule)
+        if df_all is not None:
             all_results.append(df_all)
 
-            print(
-                f"Original Price: {current_price:.2f} | "
-                f"Recommended Price: {new_price:.2f} | "
-                f"Impact: {impact_abs:.2f} ({impact_pct:.1f}%)"
-            )
-
-        except Exception as e:
-            print(f" Error in row {idx}: {e}")
-            continue
-
     # =========================
     # SAVE ALL RESULTS
     # =========================
@@ -273,7 +410,7 @@ def main():
         
         # Upload to MinIO staging and PostgreSQL
         print("\nUploading results to MinIO and PostgreSQL...")
-        csv_bytes = combined_df.to_csv(index=True).encode('utf-8')
+        csv_bytes = loader.dataframe_to_csv_bytes(combined_df, index=True)
         
         # Upload to MinIO
         run_id = time.strftime("%Y%m%d_%H%M%S")
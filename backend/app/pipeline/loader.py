@@ -1,11 +1,18 @@
 import os
 import io
+import csv
+import gzip
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import lru_cache
 from typing import List, Dict, Any, Optional
 
 import pandas as pd
+import urllib3
 from minio import Minio
-import psycopg2
-from psycopg2.extras import execute_values
+from minio.error import S3Error
+from psycopg2 import errors as pg_errors
+from psycopg2.pool import ThreadedConnectionPool
 from app.core.config import settings
 
 from dotenv import load_dotenv
@@ -28,44 +35,80 @@ RAW_SALES_BY_PRODUCT_PREFIX = settings.minio_raw_sales_by_product_folder
 MINIO_STAGING_BUCKET = settings.minio_staging_bucket
 MINIO_ETL_FOLDER = settings.minio_etl_folder
 
+# Staged objects from this size up go as multipart uploads of this part size
+# (S3 minimum is 5 MiB), with parts sent in parallel.
+STAGING_PART_SIZE = 16 * 1024 * 1024
+STAGING_PARALLEL_UPLOADS = settings.minio_parallel_uploads
+
 PG_HOST = settings.db_host
 PG_PORT = settings.db_port
 PG_DBNAME = settings.db_name
 PG_USER = settings.db_user
 PG_PASSWORD = settings.db_password
 
+# Parallel GETs used when pulling uploaded workbooks from the landing bucket.
+LANDING_FETCH_WORKERS = 16
+
+# Buckets already confirmed to exist in this process.
+_known_buckets = set()
+
 
 # =========================
 # MINIO HELPERS
 # =========================
 
+@lru_cache(maxsize=1)
 def _get_minio_client() -> Minio:
+    """Process-wide MinIO client; every loader call shares its connection pool."""
     return Minio(
         MINIO_ENDPOINT,
         access_key=MINIO_ACCESS_KEY,
         secret_key=MINIO_SECRET_KEY,
         secure=MINIO_SECURE,
+        http_client=urllib3.PoolManager(
+            num_pools=4,
+            maxsize=max(32, LANDING_FETCH_WORKERS),
+            timeout=urllib3.Timeout(connect=300, read=300),
+            retries=urllib3.Retry(total=3, backoff_factor=0.2),
+        ),
     )
 
 def _ensure_staging_bucket() -> None:
-    """Create staging bucket if missing (idempotent)."""
+    """Create staging bucket if missing (idempotent, checked once per process)."""
+    if MINIO_STAGING_BUCKET in _known_buckets:
+        return
     client = _get_minio_client()
-    if not client.bucket_exists(MINIO_STAGING_BUCKET):
+    # One round-trip whether or not it exists; only fall back to asking when
+    # creation is refused for another reason (e.g. no CreateBucket permission).
+    try:
         client.make_bucket(MINIO_STAGING_BUCKET)
+    except S3Error as e:
+        if e.code not in ("BucketAlreadyOwnedByYou", "BucketAlreadyExists"):
+            if not client.bucket_exists(MINIO_STAGING_BUCKET):
+                raise
+    _known_buckets.add(MINIO_STAGING_BUCKET)
+
+def dataframe_to_csv_bytes(df: pd.DataFrame, index: bool = False) -> bytes:
+    """Serialize a DataFrame to UTF-8 CSV bytes without building the whole CSV as a str first."""
+    buf = io.BytesIO()
+    df.to_csv(buf, index=index, encoding="utf-8")
+    return buf.getvalue()
 
 def staging_put_bytes(object_name: str, data: bytes, content_type: str = "text/csv") -> int:
     """Upload raw bytes to staging bucket under given object name."""
     _ensure_staging_bucket()
     client = _get_minio_client()
-    bio = io.BytesIO(data)
+    length = len(data)
     client.put_object(
         bucket_name=MINIO_STAGING_BUCKET,
         object_name=object_name,
-        data=bio,
-        length=len(data),
+        data=io.BytesIO(data),
+        length=length,
         content_type=content_type,
+        part_size=STAGING_PART_SIZE if length >= STAGING_PART_SIZE else 0,
+        num_parallel_uploads=STAGING_PARALLEL_UPLOADS,
     )
-    return len(data)
+    return length
 
 def staging_get_bytes(object_name: str) -> bytes:
     """Download object from staging bucket to bytes."""
@@ -112,17 +155,29 @@ def _load_excel_from_minio(object_name: str) -> io.BytesIO:
     return io.BytesIO(data)
 
 
+def _load_excel_objects(prefix: str) -> List[Dict[str, Any]]:
+    """
+    Download every *.xlsx under prefix concurrently, keeping listing order.
+    """
+    metas = _list_excel_objects(prefix)
+    if not metas:
+        return []
+    names = [meta["object_name"] for meta in metas]
+    with ThreadPoolExecutor(max_workers=min(LANDING_FETCH_WORKERS, len(names))) as ex:
+        fileobjs = list(ex.map(_load_excel_from_minio, names))
+    return [
+        {"object_name": name, "fileobj": fileobj}
+        for name, fileobj in zip(names, fileobjs)
+    ]
+
+
 def get_sales_files_from_minio() -> List[Dict[str, Any]]:
     """
     Return list of sales files:
     [{"object_name": str, "fileobj": BytesIO}, ...]
     from landing/raw_sales/.
     """
-    files: List[Dict[str, Any]] = []
-    for meta in _list_excel_objects(RAW_SALES_PREFIX):
-        fileobj = _load_excel_from_minio(meta["object_name"])
-        files.append({"object_name": meta["object_name"], "fileobj": fileobj})
-    return files
+    return _load_excel_objects(RAW_SALES_PREFIX)
 
 
 def get_sales_by_product_files_from_minio() -> List[Dict[str, Any]]:
@@ -131,19 +186,22 @@ def get_sales_by_product_files_from_minio() -> List[Dict[str, Any]]:
     [{"object_name": str, "fileobj": BytesIO}, ...]
     from landing/raw_sales_by_product/.
     """
-    files: List[Dict[str, Any]] = []
-    for meta in _list_excel_objects(RAW_SALES_BY_PRODUCT_PREFIX):
-        fileobj = _load_excel_from_minio(meta["object_name"])
-        files.append({"object_name": meta["object_name"], "fileobj": fileobj})
-    return files
+    return _load_excel_objects(RAW_SALES_BY_PRODUCT_PREFIX)
 
 
 # =========================
 # POSTGRES HELPERS
 # =========================
 
-def _get_pg_conn():
-    return psycopg2.connect(
+@lru_cache(maxsize=None)
+def _get_pg_pool(pid: int) -> ThreadedConnectionPool:
+    """
+    Connection pool for process `pid`, created lazily on first use. Keyed by
+    pid so forked workers open their own sockets instead of sharing ours.
+    """
+    return ThreadedConnectionPool(
+        1,
+        settings.db_pool_size + settings.db_max_overflow,
         host=PG_HOST,
         port=PG_PORT,
         dbname=PG_DBNAME,
@@ -151,18 +209,40 @@ def _get_pg_conn():
         password=PG_PASSWORD,
     )
 
-def copy_csv_bytes_to_table(csv_bytes: bytes, table_name: str, columns: List[str]) -> None:
+@contextmanager
+def _pg_conn():
     """
-    Bulk load with COPY FROM STDIN (HEADER). We explicitly list columns to avoid
-    reliance on physical column order.
+    Borrow a pooled connection. Like `with psycopg2.connect() as conn`, the
+    transaction commits on success and rolls back on error.
     """
+    pool = _get_pg_pool(os.getpid())
+    conn = pool.getconn()
+    try:
+        with conn:
+            yield conn
+    finally:
+        pool.putconn(conn, close=bool(conn.closed))
+
+def _copy_stream(cur, data_stream, table_name: str, columns: List[str]) -> None:
     collist = ", ".join(f'"{c}"' for c in columns)
     copy_sql = f"COPY {table_name} ({collist}) FROM STDIN WITH (FORMAT CSV, HEADER TRUE)"
-    with _get_pg_conn() as conn:
+    cur.copy_expert(copy_sql, data_stream)
+
+def copy_csv_stream_to_table(data_stream, table_name: str, columns: List[str]) -> None:
+    """
+    Bulk load with COPY FROM STDIN (HEADER). We explicitly list columns to avoid
+    reliance on physical column order. data_stream is any binary file-like
+    object; COPY reads it in chunks and sends the UTF-8 bytes as they are.
+    """
+    with _pg_conn() as conn:
         with conn.cursor() as cur:
-            cur.copy_expert(copy_sql, io.StringIO(csv_bytes.decode("utf-8")))
+            _copy_stream(cur, data_stream, table_name, columns)
         conn.commit()
 
+def copy_csv_bytes_to_table(csv_bytes: bytes, table_name: str, columns: List[str]) -> None:
+    """COPY in-memory CSV bytes without decoding them to a str first."""
+    copy_csv_stream_to_table(io.BytesIO(csv_bytes), table_name, columns)
+
 def upsert_dataframe(
     df: pd.DataFrame,
     table_name: str,
@@ -170,13 +250,19 @@ def upsert_dataframe(
 ):
     """
     Legacy generic UPSERT (still here; not used by buffer flow).
+    The frame is COPYed into a transaction-local temp clone of the table and
+    merged with one INSERT ... SELECT ... ON CONFLICT. Missing values are sent
+    as \\N so they load as NULL while empty strings stay empty strings.
+    Key-only (insert-if-absent) frames anti-join existing keys first, so only
+    new rows reach the conflict check.
     """
     if df is None or df.empty:
         return
 
     cols = list(df.columns)
-    records = [tuple(row[c] for c in cols) for _, row in df.iterrows()]
     col_list = ", ".join(f'"{c}"' for c in cols)
+    temp_table = f"_stg_{table_name}"
+    where_sql = ""
 
     if key_columns:
         conflict_cols = ", ".join(f'"{c}"' for c in key_columns)
@@ -185,28 +271,33 @@ def upsert_dataframe(
             set_clause = ", ".join(
                 f'"{c}" = EXCLUDED."{c}"' for c in update_cols
             )
-            sql = f"""
-                INSERT INTO {table_name} ({col_list})
-                VALUES %s
-                ON CONFLICT ({conflict_cols})
-                DO UPDATE SET {set_clause}
-            """
+            conflict_sql = f"ON CONFLICT ({conflict_cols}) DO UPDATE SET {set_clause}"
         else:
-            sql = f"""
-                INSERT INTO {table_name} ({col_list})
-                VALUES %s
-                ON CONFLICT ({conflict_cols})
-                DO NOTHING
-            """
+            # DO NOTHING stays for keys repeated within the frame and for
+            # concurrent writers; the anti-join skips everything else.
+            key_match = " AND ".join(f't."{c}" = s."{c}"' for c in key_columns)
+            where_sql = f"WHERE NOT EXISTS (SELECT 1 FROM {table_name} t WHERE {key_match})"
+            conflict_sql = f"ON CONFLICT ({conflict_cols}) DO NOTHING"
     else:
-        sql = f"""
-            INSERT INTO {table_name} ({col_list})
-            VALUES %s
-        """
+        conflict_sql = ""
 
-    with _get_pg_conn() as conn:
+    buf = io.BytesIO()
+    df[cols].to_csv(buf, index=False, header=False, na_rep="\\N", encoding="utf-8")
+    buf.seek(0)
+
+    with _pg_conn() as conn:
         with conn.cursor() as cur:
-            execute_values(cur, sql, records, page_size=1000)
+            cur.execute(
+                f"CREATE TEMP TABLE {temp_table} (LIKE {table_name} INCLUDING DEFAULTS) ON COMMIT DROP"
+            )
+            cur.copy_expert(
+                f"COPY {temp_table} ({col_list}) FROM STDIN WITH (FORMAT CSV, NULL '\\N')",
+                buf,
+            )
+            cur.execute(
+                f"INSERT INTO {table_name} ({col_list}) "
+                f"SELECT {col_list} FROM {temp_table} s {where_sql} {conflict_sql}"
+            )
         conn.commit()
 
 
@@ -244,21 +335,15 @@ def upsert_time_dimension(df: pd.DataFrame):
 # =========================
 
 def has_history_product_dimension() -> bool:
-    with _get_pg_conn() as conn:
+    # One round-trip: probe for rows and treat a missing table as empty. (A
+    # to_regclass CASE doesn't help; the table name is resolved at parse time.)
+    with _pg_conn() as conn:
         with conn.cursor() as cur:
-            cur.execute(
-                """
-                SELECT EXISTS (
-                    SELECT 1 FROM information_schema.tables
-                    WHERE table_name = 'history_product_dimension'
-                )
-                """
-            )
-            exists = cur.fetchone()[0]
-            if not exists:
+            try:
+                cur.execute("SELECT EXISTS (SELECT 1 FROM history_product_dimension LIMIT 1)")
+            except pg_errors.UndefinedTable:
+                conn.rollback()
                 return False
-
-            cur.execute("SELECT EXISTS (SELECT 1 FROM history_product_dimension LIMIT 1)")
             has_rows = cur.fetchone()[0]
             return bool(has_rows)
 
@@ -267,22 +352,21 @@ def fetch_history_for_products(product_ids: List[str]) -> pd.DataFrame:
     if not product_ids:
         return pd.DataFrame()
 
-    with _get_pg_conn() as conn:
-        query = """
-            SELECT
-                product_id,
-                product_name,
-                price,
-                record_version,
-                is_current,
-                last_transaction_datetime,
-                parent_sku,
-                category,
-                product_cost
-            FROM history_product_dimension
-            WHERE product_id = ANY(%s)
-        """
-        return pd.read_sql(query, conn, params=(product_ids,))
+    query = """
+        SELECT
+            product_id,
+            product_name,
+            price,
+            record_version,
+            is_current,
+            last_transaction_datetime,
+            parent_sku,
+            category,
+            product_cost
+        FROM history_product_dimension
+        WHERE product_id = ANY(%s)
+    """
+    return read_query_via_copy(query, (product_ids,))
 
 
 # =========================
@@ -299,20 +383,90 @@ def bulk_load_from_staging(prefix: str, plan: List[Dict[str, Any]]) -> None:
     """
     if prefix and not prefix.endswith("/"):
         prefix = prefix + "/"
-    for step in plan:
-        obj_name = prefix + step["filename"]
-        csv_bytes = staging_get_bytes(obj_name)
-        copy_csv_bytes_to_table(csv_bytes, step["table"], step["columns"])
+    client = _get_minio_client()
+    obj_names = [prefix + step["filename"] for step in plan]
+
+    def _open(i):
+        return client.get_object(MINIO_STAGING_BUCKET, obj_names[i]) if i < len(obj_names) else None
+
+    def _release(resp):
+        if resp is not None:
+            resp.close()
+            resp.release_conn()
+
+    # The whole plan loads in one transaction on one connection. While a
+    # step COPYs, the next object's GET is already being opened.
+    with _pg_conn() as conn, ThreadPoolExecutor(max_workers=1) as prefetch:
+        pending = prefetch.submit(_open, 0)
+        try:
+            for i, step in enumerate(plan):
+                resp = pending.result()
+                pending = prefetch.submit(_open, i + 1)
+                try:
+                    # Stream the object straight into COPY (gunzipping .gz on
+                    # the fly) instead of downloading it whole first.
+                    data_stream = gzip.GzipFile(fileobj=resp) if obj_names[i].endswith(".gz") else resp
+                    with conn.cursor() as cur:
+                        _copy_stream(cur, data_stream, step["table"], step["columns"])
+                finally:
+                    _release(resp)
+        finally:
+            if pending.exception() is None:
+                _release(pending.result())
 
 
 # =========================
 # EXPORT DATA FROM POSTGRES (for model inputs)
 # =========================
 
-def export_table_to_csv(table_name: str) -> pd.DataFrame:
-    """Export entire table from PostgreSQL to DataFrame."""
-    with _get_pg_conn() as conn:
-        return pd.read_sql(f"SELECT * FROM {table_name}", conn)
+# Postgres type OIDs that need more than plain string parsing
+_PG_BOOL_OIDS = {16}
+_PG_INT_OIDS = {20, 21, 23}
+_PG_FLOAT_OIDS = {700, 701, 1700}
+_PG_DATE_OIDS = {1082}
+_PG_TIMESTAMP_OIDS = {1114, 1184}
+
+def read_query_via_copy(query: str, params=None) -> pd.DataFrame:
+    """
+    Run a SELECT through COPY ... TO STDOUT and parse it with read_csv, which
+    is far cheaper than building a Python tuple per row. Column dtypes follow
+    what pd.read_sql gave: strings for text, int64 (float64 with NULLs) for
+    integers, float64 for numeric, datetime.date objects for DATE, datetime64
+    for TIMESTAMP, bool (object with NULLs) for BOOLEAN, all-object when empty.
+    """
+    with _pg_conn() as conn:
+        with conn.cursor() as cur:
+            if params is not None:
+                query = cur.mogrify(query, params).decode("utf-8")
+            cur.execute(f"SELECT * FROM ({query}) AS q LIMIT 0")
+            types = {d.name: d.type_code for d in cur.description}
+            buf = io.BytesIO()
+            cur.copy_expert(f"COPY ({query}) TO STDOUT WITH (FORMAT CSV, HEADER TRUE, NULL '\\N')", buf)
+    buf.seek(0)
+
+    # Only \N is NULL, so empty strings and text like "NA" survive as-is.
+    dtype = {c: (float if t in _PG_FLOAT_OIDS else str) for c, t in types.items() if t not in _PG_INT_OIDS}
+    na_values = {c: ["\\N", "NaN"] if t in _PG_FLOAT_OIDS else ["\\N"] for c, t in types.items()}
+    df = pd.read_csv(buf, dtype=dtype, keep_default_na=False, na_values=na_values)
+    if df.empty:
+        return pd.DataFrame({c: pd.Series([], dtype=object) for c in types})
+
+    for c, t in types.items():
+        if t in _PG_BOOL_OIDS:
+            df[c] = df[c].map({"t": True, "f": False})
+            if df[c].isna().any():
+                df[c] = df[c].astype(object).where(df[c].notna(), None)
+        elif t in _PG_DATE_OIDS:
+            parsed = pd.to_datetime(df[c], format="ISO8601")
+            df[c] = parsed.dt.date.astype(object).where(parsed.notna(), None)
+        elif t in _PG_TIMESTAMP_OIDS:
+            df[c] = pd.to_datetime(df[c], format="ISO8601")
+    return df
+
+def export_table_to_csv(table_name: str, columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """Export a table (all columns, or just `columns`) from PostgreSQL to DataFrame."""
+    collist = ", ".join(f'"{c}"' for c in columns) if columns else "*"
+    return read_query_via_copy(f"SELECT {collist} FROM {table_name}")
 
 
 # =========================
@@ -321,7 +475,7 @@ def export_table_to_csv(table_name: str) -> pd.DataFrame:
 
 def clear_result_table(table_name: str) -> None:
     """Delete all data from a result table."""
-    with _get_pg_conn() as conn:
+    with _pg_conn() as conn:
         with conn.cursor() as cur:
             cur.execute(f"DELETE FROM {table_name}")
         conn.commit()
@@ -329,10 +483,9 @@ def clear_result_table(table_name: str) -> None:
 
 def load_result_csv_to_table(csv_bytes: bytes, table_name: str) -> None:
     """Load CSV bytes directly into result table (assumes columns match)."""
-    # Read CSV to get column names
-    import io
-    df = pd.read_csv(io.BytesIO(csv_bytes))
-    columns = list(df.columns)
+    # Parse only the header record to get column names
+    header = io.TextIOWrapper(io.BytesIO(csv_bytes), encoding="utf-8", newline="")
+    columns = next(csv.reader(header))
     
     # Use COPY to load
     copy_csv_bytes_to_table(csv_bytes, table_name, columns)
\ No newline at end of file
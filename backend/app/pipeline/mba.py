@@ -1,11 +1,22 @@
 # Market Basket Analysis - Properly Optimized Version
 # Used FP-Growth algorithm to find frequent itemsets and association rules
 
+import contextlib
+import io
 import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
 import pandas as pd
+from scipy import sparse
 from mlxtend.frequent_patterns import fpgrowth, association_rules
 import time
 
+# --- CONFIG ---
+MIN_SUPPORT = 0.003
+# Only 1 -> 1 rules are kept, and those come from itemsets of size 2
+MAX_ITEMSET_LEN = 2
+MBA_WORKERS = min(3, os.cpu_count() or 1)   # FOOD, DRINK and MEAL run side by side
+
 # --- HELPER FUNCTIONS ---
 
 def translate_ids_to_names(id_string, id_to_name_map):
@@ -38,37 +49,88 @@ def map_skus_to_product_ids(sku_string, sku_to_product_id_map):
     # Filter out None values if a SKU wasn't in the map
     return ','.join(sorted([pid for pid in product_ids if pid]))
 
+def apply_per_unique(values, func):
+    """
+    Series.apply(func) that calls func once per distinct value (nulls once,
+    as None) and broadcasts the results back. Basket strings repeat a lot.
+    """
+    codes, uniques = pd.factorize(values)
+    results = np.array([func(v) for v in uniques] + [func(None)], dtype=object)
+    return pd.Series(results[codes], index=values.index)
+
+def encode_baskets(product_ids):
+    """
+    Tokenizes the comma-separated product_ids column once into flat int codes.
+    Returns {'tx': row position per token, 'codes': vocab code per token,
+    'vocab': sorted Index of distinct tokens, 'n_tx': number of rows}.
+    """
+    tokens = product_ids.astype(str).str.split(',').explode().str.strip()
+    codes, vocab = pd.factorize(tokens, sort=True)
+    counts = product_ids.astype(str).str.count(',').to_numpy() + 1
+    tx = np.repeat(np.arange(len(product_ids)), counts)
+    return {'tx': tx, 'codes': codes, 'vocab': pd.Index(vocab), 'n_tx': len(product_ids)}
+
+def transactions_with_any(baskets, ids):
+    """Boolean row mask: True where the transaction holds any product in ids."""
+    in_ids = baskets['vocab'].isin(ids)
+    hits = baskets['tx'][in_ids[baskets['codes']]]
+    return np.bincount(hits, minlength=baskets['n_tx']) > 0
+
+def one_hot_baskets(baskets, mask, item_ids):
+    """
+    Sparse boolean one-hot of the masked transactions, restricted to the
+    products in item_ids that occur in them (sorted, like get_dummies).
+    """
+    n_vocab = len(baskets['vocab'])
+    row_pos = np.cumsum(mask) - 1
+    keep = mask[baskets['tx']]
+    tx, codes = row_pos[baskets['tx'][keep]], baskets['codes'][keep]
+
+    used = (np.bincount(codes, minlength=n_vocab) > 0) & baskets['vocab'].isin(item_ids)
+    col_of = np.cumsum(used) - 1
+    keep = used[codes]
+    tx, cols = tx[keep], col_of[codes[keep]]
+
+    matrix = sparse.csr_matrix(
+        (np.ones(len(tx), dtype=bool), (tx, cols)),
+        shape=(int(mask.sum()), int(used.sum())),
+    )
+    return pd.DataFrame.sparse.from_spmatrix(matrix, columns=baskets['vocab'][used])
+
+def mine_frequent_itemsets(one_hot, min_support=MIN_SUPPORT):
+    """
+    Frequent itemsets (support, itemsets) for association_rules. Mining
+    stops at MAX_ITEMSET_LEN: deeper itemsets only yield multi-item rules,
+    which are filtered out anyway.
+    """
+    return fpgrowth(one_hot, min_support=min_support, use_colnames=True, max_len=MAX_ITEMSET_LEN)
+
 # --- MBA ANALYSIS FUNCTIONS ---
 
-def run_mba_for_category(df, category_name, cat_product_ids, id_to_name_map, all_rules):
-    """Runs the full MBA process for a single product category."""
+def run_mba_for_category(baskets, category_name, cat_product_ids, id_to_name_map):
+    """
+    Runs the full MBA process for a single product category. Returns the
+    category's top rules, or None when no transaction touches it.
+    """
     print(f"\n--- Running MBA for category: {category_name} ---")
 
-    # OPTIMIZED: Vectorized transaction filtering (no .apply)
+    # OPTIMIZED: bitmap lookup over the pre-tokenized baskets (no explode per category)
     print("Filtering transactions for category (vectorized)...")
-    s_exploded = df['product_ids'].astype(str).str.split(',').explode()
-    s_in_cat = s_exploded.str.strip().isin(cat_product_ids)
-    
-    # Group by original index (level=0) and check if .any() item was in the category
-    mask = s_in_cat.groupby(level=0).any()
-    df_cat = df[mask].copy()
+    mask = transactions_with_any(baskets, cat_product_ids)
+    n_cat = int(mask.sum())
 
-    if df_cat.empty:
+    if n_cat == 0:
         print(f"No transactions found for category {category_name}.")
-        return all_rules
+        return None
     
-    print(f"Found {len(df_cat)} transactions for {category_name}.")
+    print(f"Found {n_cat} transactions for {category_name}.")
 
-    print("One hot encoding...")
-    one_hot_cat = df_cat['product_ids'].astype(str).str.get_dummies(sep=',')
-    one_hot_cat.columns = [c.strip() for c in one_hot_cat.columns]
-    # Filter columns that are not in the category
-    cols_to_keep = [col for col in one_hot_cat.columns if col in cat_product_ids]
-    one_hot_cat = one_hot_cat[cols_to_keep]
-    one_hot_cat = one_hot_cat.astype(bool)
+    print("One hot encoding (sparse)...")
+    # Only category columns are kept
+    one_hot_cat = one_hot_baskets(baskets, mask, cat_product_ids)
 
     print("Running FP-Growth algorithm...")
-    frequent_itemsets_cat = fpgrowth(one_hot_cat, min_support=0.003, use_colnames=True)
+    frequent_itemsets_cat = mine_frequent_itemsets(one_hot_cat)
 
     if frequent_itemsets_cat.empty:
         print("No frequent itemsets found.")
@@ -78,11 +140,11 @@ def run_mba_for_category(df, category_name, cat_product_ids, id_to_name_map, all
         rules_cat = rules_cat[(rules_cat['lift'] >= 1)].sort_values(['confidence', 'lift'], ascending=[False, False])
         rules_cat = rules_cat[rules_cat['antecedents'].apply(lambda x: len(x) == 1) & rules_cat['consequents'].apply(lambda x: len(x) == 1)]
 
-        # Filter to rules where all items are in the category (safeguard)
-        rules_filtered_cat = rules_cat[
-            rules_cat['antecedents'].apply(lambda fset: fset.issubset(cat_product_ids)) & 
-            rules_cat['consequents'].apply(lambda fset: fset.issubset(cat_product_ids))
-        ].copy()
+        # Filter to rules where all items are in the category (safeguard);
+        # both sides are single items at this point
+        ant = rules_cat['antecedents'].map(lambda f: next(iter(f)))
+        con = rules_cat['consequents'].map(lambda f: next(iter(f)))
+        rules_filtered_cat = rules_cat[ant.isin(cat_product_ids) & con.isin(cat_product_ids)].copy()
 
         if rules_filtered_cat.empty:
             print("No association rules found for category.")
@@ -104,8 +166,8 @@ def run_mba_for_category(df, category_name, cat_product_ids, id_to_name_map, all
     # Translate IDs to Names
     association_rules_export.rename(columns={'antecedents_sku': 'antecedents_names', 'consequents_sku': 'consequents_names'}, inplace=True)
     if not association_rules_export.empty:
-        association_rules_export['antecedents_names'] = association_rules_export['antecedents_names'].apply(lambda x: translate_ids_to_names(x, id_to_name_map))
-        association_rules_export['consequents_names'] = association_rules_export['consequents_names'].apply(lambda x: translate_ids_to_names(x, id_to_name_map))
+        association_rules_export['antecedents_names'] = apply_per_unique(association_rules_export['antecedents_names'], lambda x: translate_ids_to_names(x, id_to_name_map))
+        association_rules_export['consequents_names'] = apply_per_unique(association_rules_export['consequents_names'], lambda x: translate_ids_to_names(x, id_to_name_map))
     association_rules_export['category'] = category_name
 
     # Remove reversed duplicates
@@ -124,41 +186,37 @@ def run_mba_for_category(df, category_name, cat_product_ids, id_to_name_map, all
         cols.insert(0, cols.pop(cols.index('bundle_id')))
         association_rules_export = association_rules_export[cols]
 
-    all_rules = pd.concat([all_rules, association_rules_export], ignore_index=True)
-    return all_rules
+    return association_rules_export
 
-def run_mba_for_meal(df, food_ids, drink_ids, id_to_name_map, all_rules):
-    """Runs the full MBA process for MEAL (Food <-> Drink) combinations."""
+def run_mba_for_meal(baskets, food_ids, drink_ids, id_to_name_map):
+    """
+    Runs the full MBA process for MEAL (Food <-> Drink) combinations.
+    Returns the top rules, or None when no transaction has both.
+    """
     print(f"\n--- Running MBA for MEAL (FOOD <-> DRINK) ---")
 
-    # OPTIMIZED: Vectorized transaction filtering (no .apply)
+    # OPTIMIZED: bitmap lookup over the pre-tokenized baskets (no explode)
     print("Filtering transactions for MEAL (vectorized)...")
-    s_exploded = df['product_ids'].astype(str).str.split(',').explode().str.strip()
     
     # Check for food and drink presence separately, then combine
-    has_food = s_exploded.isin(food_ids).groupby(level=0).any()
-    has_drink = s_exploded.isin(drink_ids).groupby(level=0).any()
+    has_food = transactions_with_any(baskets, food_ids)
+    has_drink = transactions_with_any(baskets, drink_ids)
     
     mask = has_food & has_drink
-    df_meal = df[mask].copy()
+    n_meal = int(mask.sum())
     
-    if df_meal.empty:
+    if n_meal == 0:
         print("No transactions found with both FOOD and DRINK.")
-        return all_rules
+        return None
 
-    print(f"Found {len(df_meal)} MEAL transactions.")
-    
-    print("One hot encoding...")
-    one_hot_meal = df_meal['product_ids'].astype(str).str.get_dummies(sep=',')
-    one_hot_meal.columns = [c.strip() for c in one_hot_meal.columns]
+    print(f"Found {n_meal} MEAL transactions.")
     
+    print("One hot encoding (sparse)...")
     # Keep only food and drink columns
-    cols_to_keep = [col for col in one_hot_meal.columns if col in food_ids or col in drink_ids]
-    one_hot_meal = one_hot_meal[cols_to_keep]
-    one_hot_meal = one_hot_meal.astype(bool)
+    one_hot_meal = one_hot_baskets(baskets, mask, food_ids | drink_ids)
 
     print("Running FP-Growth algorithm...")
-    frequent_itemsets_meal = fpgrowth(one_hot_meal, min_support=0.003, use_colnames=True)
+    frequent_itemsets_meal = mine_frequent_itemsets(one_hot_meal)
 
     if frequent_itemsets_meal.empty:
         print("No frequent itemsets found for MEAL.")
@@ -168,15 +226,11 @@ def run_mba_for_meal(df, food_ids, drink_ids, id_to_name_map, all_rules):
         rules_meal = rules_meal[(rules_meal['lift'] >= 1)].sort_values(['confidence', 'lift'], ascending=[False, False])
         rules_meal = rules_meal[rules_meal['antecedents'].apply(lambda x: len(x) == 1) & rules_meal['consequents'].apply(lambda x: len(x) == 1)]
 
-        # Use efficient issubset check
-        def is_meal_rule(antecedents, consequents):
-            a_is_food = antecedents.issubset(food_ids)
-            a_is_drink = antecedents.issubset(drink_ids)
-            c_is_food = consequents.issubset(food_ids)
-            c_is_drink = consequents.issubset(drink_ids)
-            return (a_is_food and c_is_drink) or (a_is_drink and c_is_food)
-
-        rules_filtered_meal = rules_meal[rules_meal.apply(lambda row: is_meal_rule(row['antecedents'], row['consequents']), axis=1)].copy()
+        # Food -> Drink or Drink -> Food; both sides are single items at this point
+        ant = rules_meal['antecedents'].map(lambda f: next(iter(f)))
+        con = rules_meal['consequents'].map(lambda f: next(iter(f)))
+        is_meal_rule = (ant.isin(food_ids) & con.isin(drink_ids)) | (ant.isin(drink_ids) & con.isin(food_ids))
+        rules_filtered_meal = rules_meal[is_meal_rule].copy()
 
         if rules_filtered_meal.empty:
             print("No meal association rules found.")
@@ -198,8 +252,8 @@ def run_mba_for_meal(df, food_ids, drink_ids, id_to_name_map, all_rules):
     # Translate IDs to Names
     association_rules_export.rename(columns={'antecedents_sku': 'antecedents_names', 'consequents_sku': 'consequents_names'}, inplace=True)
     if not association_rules_export.empty:
-        association_rules_export['antecedents_names'] = association_rules_export['antecedents_names'].apply(lambda x: translate_ids_to_names(x, id_to_name_map))
-        association_rules_export['consequents_names'] = association_rules_export['consequents_names'].apply(lambda x: translate_ids_to_names(x, id_to_name_map))
+        association_rules_export['antecedents_names'] = apply_per_unique(association_rules_export['antecedents_names'], lambda x: translate_ids_to_names(x, id_to_name_map))
+        association_rules_export['consequents_names'] = apply_per_unique(association_rules_export['consequents_names'], lambda x: translate_ids_to_names(x, id_to_name_map))
     association_rules_export['category'] = 'MEAL'
 
     # Remove reversed duplicates
@@ -217,8 +271,16 @@ def run_mba_for_meal(df, food_ids, drink_ids, id_to_name_map, all_rules):
         cols.insert(0, cols.pop(cols.index('bundle_id')))
         association_rules_export = association_rules_export[cols]
 
-    all_rules = pd.concat([all_rules, association_rules_export], ignore_index=True)
-    return all_rules
+    return association_rules_export
+
+def run_mba_pass(func, *args):
+    """
+    Runs one run_mba_for_* pass. Returns what it printed along with its
+    rules, so main can print logs in pass order whichever worker ran it.
+    """
+    with contextlib.redirect_stdout(io.StringIO()) as log:
+        rules = func(*args)
+    return log.getvalue(), rules
 
 
 # --- MAIN EXECUTION ---
@@ -275,35 +337,45 @@ def main():
     # Map SKUs to product_ids
     print("Mapping SKUs to product_ids...")
     sku_col = 'sku' if 'sku' in df.columns else 'SKU'
-    df['product_ids'] = df[sku_col].apply(lambda x: map_skus_to_product_ids(x, sku_to_product_id))
+    df['product_ids'] = apply_per_unique(df[sku_col], lambda x: map_skus_to_product_ids(x, sku_to_product_id))
+    baskets = encode_baskets(df['product_ids'])
 
     # Get category sets (handle both uppercase CATEGORY and lowercase category)
     category_col = 'category' if 'category' in prod_dim.columns else 'CATEGORY'
     excluded_cats = {'EXTRA', 'OTHERS'}
-    excluded_tokens = set(prod_dim[prod_dim[category_col].isin(excluded_cats)]['product_id'].astype(str).str.strip())
-    food_ids = set(prod_dim[prod_dim[category_col] == 'FOOD']['product_id'].astype(str).str.strip())
-    drink_ids = set(prod_dim[prod_dim[category_col] == 'DRINK']['product_id'].astype(str).str.strip())
+    excluded_tokens = set(prod_dim.loc[prod_dim[category_col].isin(excluded_cats), 'product_id_clean'])
+    food_ids = set(prod_dim.loc[prod_dim[category_col] == 'FOOD', 'product_id_clean'])
+    drink_ids = set(prod_dim.loc[prod_dim[category_col] == 'DRINK', 'product_id_clean'])
 
     print(f"Excluding {len(excluded_tokens)} product_ids from categories: {excluded_cats}")
     
     # --- Run Main Analysis ---
-    all_rules = pd.DataFrame()
-    
-    # Get category-specific ID sets
-    food_cat_ids = set(prod_dim[prod_dim[category_col] == 'FOOD']['product_id'].astype(str).str.strip())
-    drink_cat_ids = set(prod_dim[prod_dim[category_col] == 'DRINK']['product_id'].astype(str).str.strip())
-    
-    # Run analysis
-    all_rules = run_mba_for_category(df, 'FOOD', food_cat_ids, id_to_name, all_rules)
-    all_rules = run_mba_for_category(df, 'DRINK', drink_cat_ids, id_to_name, all_rules)
-    all_rules = run_mba_for_meal(df, food_ids, drink_ids, id_to_name, all_rules)
+    # The three passes are independent
+    passes = [
+        (run_mba_for_category, baskets, 'FOOD', food_ids, id_to_name),
+        (run_mba_for_category, baskets, 'DRINK', drink_ids, id_to_name),
+        (run_mba_for_meal, baskets, food_ids, drink_ids, id_to_name),
+    ]
+    if MBA_WORKERS > 1:
+        with ProcessPoolExecutor(max_workers=MBA_WORKERS) as pool:
+            futures = [pool.submit(run_mba_pass, *p) for p in passes]
+            outcomes = [f.result() for f in futures]
+    else:
+        outcomes = [run_mba_pass(*p) for p in passes]
+
+    rule_frames = []
+    for log, rules in outcomes:
+        print(log, end="")
+        if rules is not None:
+            rule_frames.append(rules)
+    all_rules = pd.concat(rule_frames, ignore_index=True) if rule_frames else pd.DataFrame()
 
     # Convert column names to snake_case
     all_rules.columns = [col.replace(' ', '_').lower() for col in all_rules.columns]
     
     # Upload to MinIO staging and PostgreSQL
     print("\nUploading results to MinIO and PostgreSQL...")
-    csv_bytes = all_rules.to_csv(index=False).encode('utf-8')
+    csv_bytes = loader.dataframe_to_csv_bytes(all_rules)
     
     # Upload to MinIO
     import time as tm
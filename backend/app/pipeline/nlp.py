@@ -6,10 +6,8 @@ while respecting COGS constraints and minimum discount requirements.
 
 import os
 import sys
-import math
 import pandas as pd
 import numpy as np
-from scipy.optimize import minimize
 
 # =========================
 # USER CONFIGURATION
@@ -21,6 +19,9 @@ DEFAULT_COGS_MULTIPLIER = 0.60
 # Minimum discount percentage (e.g., 0.1 means 10% discount minimum)
 MIN_DISCOUNT_PCT = 0.10
 
+# Largest x for which exp(x) is still a finite float (~709.78)
+MAX_LOG_FLOAT = float(np.log(np.finfo(float).max))
+
 # =========================
 # Helpers
 # =========================
@@ -34,37 +35,39 @@ def require_columns(df: pd.DataFrame, cols: list[str], name: str):
         sys.exit(1)
 
 
-def safe_float(value, default=0.0):
-    """Safely convert value to float"""
-    try:
-        return float(value) if pd.notna(value) else default
-    except (ValueError, TypeError):
-        return default
+def safe_float(values: pd.Series, default=0.0) -> pd.Series:
+    """Safely convert a Series to float; missing or non-numeric values become default"""
+    return pd.to_numeric(values, errors='coerce').astype(float).fillna(default)
 
 
-def get_product_info(product_df: pd.DataFrame, product_id: str) -> dict:
-    """Get product name, price, and COGS for a given product_id"""
-    row = product_df[product_df['product_id'].astype(str) == str(product_id)]
-    if row.empty:
-        return None
+def round_values(values, ndigits: int) -> list:
+    """Python round() per element (np.round can differ on ties like 2.675)"""
+    return [round(float(v), ndigits) for v in values]
 
-    info = {
-        'product_id': str(product_id),
-        'product_name': str(row['product_name'].iloc[0]),
-        'current_price': safe_float(row['Price'].iloc[0], 0.0)
-    }
 
-    # Check for product_cost column (from ETL) first, then COGS, then default
-    if 'product_cost' in row.columns and pd.notna(row['product_cost'].iloc[0]):
-        info['cogs'] = safe_float(row['product_cost'].iloc[0],
-                                  info['current_price'] * DEFAULT_COGS_MULTIPLIER)
-    elif 'COGS' in row.columns and pd.notna(row['COGS'].iloc[0]):
-        info['cogs'] = safe_float(row['COGS'].iloc[0],
-                                  info['current_price'] * DEFAULT_COGS_MULTIPLIER)
-    else:
-        info['cogs'] = info['current_price'] * DEFAULT_COGS_MULTIPLIER
+def exp_or_inf(log_values):
+    """exp() of log-space values, reporting inf explicitly where it would overflow"""
+    log_values = np.asarray(log_values, dtype=float)
+    return np.where(log_values > MAX_LOG_FLOAT, np.inf, np.exp(np.minimum(log_values, MAX_LOG_FLOAT)))
 
-    return info
+
+def product_info_by_id(product_df: pd.DataFrame) -> pd.DataFrame:
+    """Product name, price, and COGS indexed by product_id (first row per id)"""
+    products = product_df.drop_duplicates('product_id').set_index('product_id')
+    current_price = safe_float(products['Price'], 0.0)
+
+    # product_cost column (from ETL) first, then COGS, then default
+    cogs = current_price * DEFAULT_COGS_MULTIPLIER
+    if 'COGS' in products.columns:
+        cogs = safe_float(products['COGS'], cogs)
+    if 'product_cost' in products.columns:
+        cogs = safe_float(products['product_cost'], cogs)
+
+    return pd.DataFrame({
+        'product_name': products['product_name'].map(str),
+        'current_price': current_price,
+        'cogs': cogs,
+    })
 
 
 def extract_product_ids_from_bundle(bundle_name: str) -> tuple:
@@ -87,39 +90,36 @@ def extract_product_ids_from_bundle(bundle_name: str) -> tuple:
 # =========================
 
 
-def objective_function(P, epsilon, K):
+def profit_maximizing_price(epsilon, cogs_total, min_price, price_cap):
     """
-    Objective: Maximize profit = (P - COGS_total) * Q
-    where Q = K * P^epsilon (constant elasticity demand)
-
-    For optimization, we minimize negative profit.
+    Closed-form argmax of (P - C) * K * P^epsilon on [min_price, price_cap],
+    elementwise over arrays.
+
+    d/dP = K * P^(epsilon-1) * ((epsilon+1) * P - epsilon * C), so for
+    elastic demand (epsilon < -1) the single stationary point is
+    P* = epsilon * C / (epsilon + 1). Otherwise profit rises with P all the
+    way to the cap. P* is then clipped to the bounds. K only scales profit,
+    so it plays no part here.
     """
-    if P <= 0:
-        return 1e10  # Large penalty for invalid price
+    with np.errstate(divide='ignore', invalid='ignore'):
+        p_star = np.where(epsilon < -1, epsilon * cogs_total / (epsilon + 1.0), price_cap)
+    return np.minimum(np.maximum(p_star, min_price), price_cap)
 
-    Q = K * (P ** epsilon)
-    return -Q  # We want to maximize Q at optimal price, so minimize -Q
 
-
-def optimize_bundle_price(bundle_data: dict) -> dict:
+def optimize_bundle_prices(epsilon, log_K, cogs_total, current_price_total) -> dict:
     """
-    Optimize bundle price using NLP.
+    Optimize bundle prices for profit under constant-elasticity demand, for
+    all bundles at once (NumPy arrays, one entry per bundle).
 
-    Parameters from bundle_data:
     - epsilon: price elasticity of demand
-    - K: base demand factor (exp(intercept))
+    - log_K: log of the base demand factor (the PED intercept)
     - cogs_total: combined COGS of products A and B
     - current_price_total: sum of individual current prices
-    - min_price: minimum allowed price (COGS_total / (1 - MIN_DISCOUNT_PCT))
-    - max_price: maximum allowed price (current_price_total)
+    - min price: max(current_price_total * (1 - MIN_DISCOUNT_PCT), COGS_total / (1 - MIN_DISCOUNT_PCT))
+    - max price: current_price_total
 
-    Returns optimized results dictionary
+    Returns a dictionary of unrounded arrays
     """
-    epsilon = bundle_data['epsilon']
-    K = bundle_data['K']
-    cogs_total = bundle_data['cogs_total']
-    current_price_total = bundle_data['current_price_total']
-
     # Price constraints
     # Minimum price: must cover COGS and allow for minimum discount
     price_cap = current_price_total
@@ -131,41 +131,19 @@ def optimize_bundle_price(bundle_data: dict) -> dict:
         (1 - MIN_DISCOUNT_PCT) if MIN_DISCOUNT_PCT < 1 else cogs_total * 1.1
 
     # Use the more restrictive minimum
-    min_price = max(min_price, cogs_constraint_min)
-
-    # Constraints for scipy.optimize
-    bounds = [(min_price, price_cap)]
-
-    # Initial guess: midpoint between min and max
-    P0 = (min_price + price_cap) / 2
-
-    # Optimize
-    result = minimize(
-        lambda P: objective_function(P[0], epsilon, K),
-        x0=[P0],
-        method='L-BFGS-B',
-        bounds=bounds
-    )
-
-    if not result.success:
-        # Optimization failed, use midpoint as fallback
-        optimal_price = P0
-        quantity_demanded = K * (optimal_price ** epsilon)
-        profit = (optimal_price - cogs_total) * quantity_demanded
-    else:
-        optimal_price = float(result.x[0])
-        quantity_demanded = K * (optimal_price ** epsilon)
-        profit = (optimal_price - cogs_total) * quantity_demanded
+    min_price = np.maximum(min_price, cogs_constraint_min)
+
+    # Profit is unimodal in P, so the optimum is analytic (no solver needed)
+    optimal_price = profit_maximizing_price(epsilon, cogs_total, min_price, price_cap)
+    # Q = K * P^epsilon in log space; inf rather than overflow for huge K
+    quantity_demanded = exp_or_inf(log_K + epsilon * np.log(optimal_price))
+    profit = (optimal_price - cogs_total) * quantity_demanded
 
     return {
-        'bundle_price_recommended': round(optimal_price, 2),
-        'quantity_demanded': round(quantity_demanded, 4),
-        'profit': round(profit, 2),
-        'optimization_success': result.success if 'result' in locals() else False,
-        'current_price_total': current_price_total,
-        'cogs_total': round(cogs_total, 2),
-        'price_cap': round(price_cap, 2),
-        'min_discount_pct': MIN_DISCOUNT_PCT * 100
+        'bundle_price_recommended': optimal_price,
+        'quantity_demanded': quantity_demanded,
+        'profit': profit,
+        'price_cap': price_cap,
     }
 
 # =========================
@@ -173,7 +151,11 @@ def optimize_bundle_price(bundle_data: dict) -> dict:
 # =========================
 
 
-def main():
+def main(product_df: pd.DataFrame | None = None):
+    """
+    product_df: current_product_dimension as exported, when the caller
+    (run_all) already has it; loaded here otherwise. Never modified in place.
+    """
     print("=== Non-Linear Programming for Bundle Price Optimization ===")
 
     # Import loader
@@ -184,7 +166,8 @@ def main():
     print("Loading data from PostgreSQL...")
     try:
         ped_df = loader.export_table_to_csv('ped_summary')
-        product_df = loader.export_table_to_csv('current_product_dimension')
+        if product_df is None:
+            product_df = loader.export_table_to_csv('current_product_dimension')
     except Exception as e:
         print(f"Error loading data: {e}")
         print(f"Make sure to run mba.py and ped.py first.")
@@ -192,7 +175,7 @@ def main():
 
     # Normalize column names
     ped_df.columns = [c.lower() for c in ped_df.columns]
-    product_df.columns = [c.lower() for c in product_df.columns]
+    product_df = product_df.rename(columns=str.lower)
     
     # Sanity checks
     require_columns(ped_df, ['product_name_1', 'product_name_2', 'elasticity_epsilon',
@@ -201,6 +184,8 @@ def main():
     
     # Rename for compatibility with existing code
     product_df = product_df.rename(columns={'price': 'Price'})
+    # Products are looked up by string id
+    product_df['product_id'] = product_df['product_id'].astype(str)
 
     # Check if cost column exists
     has_cost_column = 'product_cost' in product_df.columns or 'COGS' in product_df.columns
@@ -211,119 +196,95 @@ def main():
     elif 'product_cost' in product_df.columns:
         print(f"[INFO] Using 'product_cost' column from ETL output.\n")
 
-    # Process each bundle from PED results
-    results = []
-    skipped = []
-
-    for idx, row in ped_df.iterrows():
-        # Use product_name_1 and product_name_2 from PED output
-        name_a = str(row['product_name_1'])
-        name_b = str(row['product_name_2'])
-        bundle_name = f"{name_a} + {name_b}"
-
-        bundle_id = str(row.get('bundle_id', f'B{idx+1:02d}'))
-        category = str(row.get('category', 'UNKNOWN'))
-        epsilon = safe_float(row['elasticity_epsilon'], 0.0)
-        intercept = safe_float(row['intercept_logk'], 0.0)
-        r2 = safe_float(row['r2_logspace'], float('nan'))
-        n_points = int(row.get('n_price_points', 0))
-
-        # Skip if insufficient data or invalid elasticity
-        if n_points < 2 or math.isnan(r2) or epsilon >= 0:
-            skipped.append({
-                'bundle_id': bundle_id,
-                'bundle_name': bundle_name,
-                'reason': 'Insufficient data or invalid elasticity (ε >= 0)'
-            })
-            continue
-
-        # Get product information by matching names directly
-        prod_a_row = product_df[product_df['product_name'].astype(
-            str) == name_a]
-        prod_b_row = product_df[product_df['product_name'].astype(
-            str) == name_b]
-
-        if prod_a_row.empty or prod_b_row.empty:
-            skipped.append({
-                'bundle_id': bundle_id,
-                'bundle_name': bundle_name,
-                'reason': 'Product(s) not found in dimension'
-            })
-            continue
-
-        info_a = get_product_info(product_df, prod_a_row['product_id'].iloc[0])
-        info_b = get_product_info(product_df, prod_b_row['product_id'].iloc[0])
-
-        if not info_a or not info_b:
-            skipped.append({
-                'bundle_id': bundle_id,
-                'bundle_name': bundle_name,
-                'reason': 'Could not retrieve product info'
-            })
-            continue
-
-        # Calculate totals
-        cogs_total = info_a['cogs'] + info_b['cogs']
-        current_price_total = info_a['current_price'] + info_b['current_price']
-
-        # Base demand factor K = exp(intercept)
-        K = np.exp(intercept)
-
-        # Prepare bundle data for optimization
-        bundle_data = {
-            'epsilon': epsilon,
-            'K': K,
-            'cogs_total': cogs_total,
-            'current_price_total': current_price_total
-        }
-
-        # Optimize
-        opt_result = optimize_bundle_price(bundle_data)
-
-        # Compile results
-        result_row = {
-            'bundle_id': bundle_id,
-            'bundle_name': bundle_name,
-            'category': category,
-            'product_a': info_a['product_name'],
-            'product_b': info_b['product_name'],
-            'product_a_price': info_a['current_price'],
-            'product_b_price': info_b['current_price'],
-            'current_price_total': current_price_total,
-            'product_a_cogs': round(info_a['cogs'], 2),
-            'product_b_cogs': round(info_b['cogs'], 2),
-            'cogs_total': opt_result['cogs_total'],
-            'elasticity_epsilon': round(epsilon, 6),
-            'base_demand_K': round(K, 6),
-            'r_squared': round(r2, 6) if not math.isnan(r2) else 'N/A',
-            'n_points': n_points,
-            'bundle_price_recommended': opt_result['bundle_price_recommended'],
-            'quantity_demanded': opt_result['quantity_demanded'],
-            'profit': opt_result['profit'],
-            'price_cap': opt_result['price_cap'],
-            'min_discount_pct': opt_result['min_discount_pct'],
-            'optimization_success': opt_result['optimization_success']
-        }
-
-        results.append(result_row)
-
-        print(f"[{bundle_id}] {bundle_name}")
+    # Per-bundle inputs from PED results (product_name_1 / product_name_2)
+    name_a = ped_df['product_name_1'].map(str)
+    name_b = ped_df['product_name_2'].map(str)
+    bundles = pd.DataFrame({
+        'bundle_id': (ped_df['bundle_id'].map(str) if 'bundle_id' in ped_df.columns
+                      else pd.Series([f'B{i+1:02d}' for i in ped_df.index], index=ped_df.index)),
+        'bundle_name': name_a + ' + ' + name_b,
+        'category': ped_df['category'].map(str) if 'category' in ped_df.columns else 'UNKNOWN',
+        'epsilon': safe_float(ped_df['elasticity_epsilon'], 0.0),
+        'intercept': safe_float(ped_df['intercept_logk'], 0.0),
+        'r2': safe_float(ped_df['r2_logspace'], float('nan')),
+        'n_points': ped_df['n_price_points'].astype(int),
+    })
+
+    # Skip if insufficient data or invalid elasticity (ε >= 0)
+    valid = (bundles['n_points'] >= 2) & bundles['r2'].notna() & (bundles['epsilon'] < 0)
+
+    # Get product information by matching names directly (first match wins)
+    products = product_info_by_id(product_df)
+    name_to_id = (product_df.assign(name_key=product_df['product_name'].astype(str))
+                  .drop_duplicates('name_key').set_index('name_key')['product_id'])
+    info_a = products.reindex(name_a.map(name_to_id))
+    info_b = products.reindex(name_b.map(name_to_id))
+    found = info_a['current_price'].notna().to_numpy() & info_b['current_price'].notna().to_numpy()
+
+    keep = valid.to_numpy() & found
+    skipped = int(len(bundles) - keep.sum())
+    bundles = bundles[keep]
+    info_a = info_a[keep]
+    info_b = info_b[keep]
+
+    epsilon = bundles['epsilon'].to_numpy()
+    cogs_a = info_a['cogs'].to_numpy()
+    cogs_b = info_b['cogs'].to_numpy()
+    price_a = info_a['current_price'].to_numpy()
+    price_b = info_b['current_price'].to_numpy()
+
+    # Calculate totals
+    cogs_total = cogs_a + cogs_b
+    current_price_total = price_a + price_b
+
+    # Base demand factor K = exp(intercept), kept in log space
+    log_K = bundles['intercept'].to_numpy()
+
+    # Optimize all bundles at once
+    opt = optimize_bundle_prices(epsilon, log_K, cogs_total, current_price_total)
+
+    # Compile results
+    results_df = pd.DataFrame({
+        'bundle_id': bundles['bundle_id'].to_numpy(),
+        'bundle_name': bundles['bundle_name'].to_numpy(),
+        'category': bundles['category'].to_numpy(),
+        'product_a': info_a['product_name'].to_numpy(),
+        'product_b': info_b['product_name'].to_numpy(),
+        'product_a_price': price_a,
+        'product_b_price': price_b,
+        'current_price_total': current_price_total,
+        'product_a_cogs': round_values(cogs_a, 2),
+        'product_b_cogs': round_values(cogs_b, 2),
+        'cogs_total': round_values(cogs_total, 2),
+        'elasticity_epsilon': round_values(epsilon, 6),
+        'base_demand_K': round_values(exp_or_inf(log_K), 6),
+        'r_squared': round_values(bundles['r2'], 6),
+        'n_points': bundles['n_points'].to_numpy(),
+        'bundle_price_recommended': round_values(opt['bundle_price_recommended'], 2),
+        'quantity_demanded': round_values(opt['quantity_demanded'], 4),
+        'profit': round_values(opt['profit'], 2),
+        'price_cap': round_values(opt['price_cap'], 2),
+        'min_discount_pct': MIN_DISCOUNT_PCT * 100,
+        'optimization_success': True,
+    })
+
+    for row in results_df.itertuples(index=False):
+        print(f"[{row.bundle_id}] {row.bundle_name}")
         print(
-            f"  Current Total: {current_price_total:.2f} | COGS Total: {opt_result['cogs_total']:.2f}")
+            f"  Current Total: {row.current_price_total:.2f} | COGS Total: {row.cogs_total:.2f}")
         print(
-            f"  Recommended Price: {opt_result['bundle_price_recommended']:.2f}")
+            f"  Recommended Price: {row.bundle_price_recommended:.2f}")
         print(
-            f"  Expected Demand: {opt_result['quantity_demanded']:.4f} | Profit: {opt_result['profit']:.2f}")
+            f"  Expected Demand: {row.quantity_demanded:.4f} | Profit: {row.profit:.2f}")
         print()
 
     # Save results
-    if results:
-        results_df = pd.DataFrame(results)
+    if not results_df.empty:
         results_df.columns = [col.replace(' ', '_').lower() for col in results_df.columns]
         
         # Upload to MinIO staging and PostgreSQL
         print("\nUploading results to MinIO and PostgreSQL...")
-        csv_bytes = results_df.to_csv(index=False).encode('utf-8')
+        csv_bytes = loader.dataframe_to_csv_bytes(results_df)
         
         # Upload to MinIO
         run_id = time.strftime("%Y%m%d_%H%M%S")
@@ -336,7 +297,7 @@ def main():
         loader.clear_result_table('nlp_optimization_results')
         loader.load_result_csv_to_table(csv_bytes, 'nlp_optimization_results')
         print("Loaded to PostgreSQL: nlp_optimization_results")
-        print(f"  Total bundles optimized: {len(results)}")
+        print(f"  Total bundles optimized: {len(results_df)}")
         
         # Clean up MinIO staging after successful load
         loader.staging_delete_prefix(f"models/nlp/{run_id}")
@@ -345,7 +306,7 @@ def main():
         print("\nNo bundles were successfully optimized.")
 
     if skipped:
-        print(f"\n  Total bundles skipped: {len(skipped)}")
+        print(f"\n  Total bundles skipped: {skipped}")
 
     print("\n=== NLP Optimization Complete ===")
 
@@ -3,8 +3,6 @@ import sys
 import math
 import numpy as np
 import pandas as pd
-from sklearn.linear_model import LinearRegression
-from sklearn.metrics import r2_score
 
 # =========================
 # USER CONFIGURATION
@@ -14,6 +12,9 @@ TOP_N        = 15
 # Toggle: use only receipts whose product set is EXACTLY {A, B} (no other items)
 STRICT_BUNDLE_ONLY = False
 
+# Fact columns the PED builders read; the rest of the table is never fetched
+FACT_COLUMNS = ['date', 'receipt_no', 'product_id', 'line_total']
+
 # =========================
 # Helpers
 # =========================
@@ -23,50 +24,62 @@ def require_columns(df: pd.DataFrame, cols: list[str], name: str):
         print(f"Error: {name} is missing columns: {missing}")
         sys.exit(1)
 
-def resolve_ids_by_exact_names(rule_row: pd.Series, product_df: pd.DataFrame) -> tuple[str | None, str | None]:
+def resolve_ids_by_exact_names(rule_row: dict, id_by_name: dict) -> tuple[str | None, str | None]:
     """EXACT product_name match. Returns (id_a, id_b) or (None, None) if not found."""
-    nameA = rule_row.get('antecedents_names', None)
-    nameB = rule_row.get('consequents_names', None)
+    nameA = rule_row.get('antecedents_names')
+    nameB = rule_row.get('consequents_names')
     if nameA is None or nameB is None:
         return None, None
-    a = product_df.loc[product_df['product_name'] == str(nameA), 'product_id']
-    b = product_df.loc[product_df['product_name'] == str(nameB), 'product_id']
-    if a.empty or b.empty:
+    a = id_by_name.get(str(nameA))
+    b = id_by_name.get(str(nameB))
+    if a is None or b is None:
         return None, None
-    return str(a.iloc[0]), str(b.iloc[0])
+    return a, b
 
-def safe_name(product_df: pd.DataFrame, product_id: str) -> str:
-    row = product_df.loc[product_df['product_id'].astype(str) == str(product_id), 'product_name']
-    return str(row.iloc[0]) if not row.empty else f"(id:{product_id})"
+def safe_name(name_by_id: dict, product_id: str) -> str:
+    name = name_by_id.get(str(product_id))
+    return str(name) if name is not None else f"(id:{product_id})"
 
 # ---------- Price–Quantity builders ----------
-def build_price_qty_points(fact_df: pd.DataFrame, id_a: str, id_b: str, strict: bool = False) -> pd.DataFrame:
+def index_fact_lines(fact_df: pd.DataFrame) -> dict:
+    """
+    One pass over the fact table, shared by every bundle:
+    - rows_by_pid: Product ID -> row positions (ascending) of its lines
+    - n_products: Receipt No -> number of distinct products on the receipt
+    """
+    return {
+        'rows_by_pid': fact_df.groupby('Product ID', sort=False).indices,
+        'n_products': fact_df.groupby('Receipt No')['Product ID'].nunique(dropna=False),
+    }
+
+def build_price_qty_points(fact_df: pd.DataFrame, fact_index: dict, id_a: str, id_b: str, strict: bool = False) -> pd.DataFrame:
     """
     Build price-quantity points for bundle (A, B).
     If strict=True: only receipts with exactly {A, B}.
     If strict=False: receipts containing both A and B (may include other items).
+    fact_index comes from index_fact_lines(fact_df).
     Returns: DataFrame[Combined_Price, Num_Transactions]
     """
     ida, idb = str(id_a), str(id_b)
+    no_rows = np.empty(0, dtype=np.intp)
     
+    # Only A/B lines, in fact-table order
+    rows = np.union1d(fact_index['rows_by_pid'].get(ida, no_rows), fact_index['rows_by_pid'].get(idb, no_rows))
+    ab_lines = fact_df.iloc[rows]
+    
+    # Receipts containing both A and B
+    n_wanted = len({ida, idb})
+    ab_count = ab_lines.groupby('Receipt No')['Product ID'].nunique()
+    target_receipts = ab_count[ab_count == n_wanted].index
     if strict:
-        # Build product set for every receipt
-        receipt_sets = fact_df.groupby('Receipt No')['Product ID'].apply(lambda s: set(s.astype(str)))
-        target_receipts = receipt_sets[receipt_sets == {ida, idb}].index
-    else:
-        # Find receipts containing both A and B
-        pair_lines = fact_df[fact_df['Product ID'].astype(str).isin([ida, idb])]
-        receipt_products = pair_lines.groupby('Receipt No')['Product ID'].apply(lambda s: set(s.astype(str)))
-        target_receipts = receipt_products[receipt_products.apply(lambda s: ida in s and idb in s)].index
+        # ...and nothing else
+        n_products = fact_index['n_products'].reindex(target_receipts)
+        target_receipts = target_receipts[(n_products == n_wanted).to_numpy()]
     
     if len(target_receipts) == 0:
         return pd.DataFrame(columns=['Combined_Price', 'Num_Transactions'])
     
-    # Get only A/B lines from target receipts
-    ab_lines = fact_df[
-        fact_df['Receipt No'].isin(target_receipts) &
-        fact_df['Product ID'].astype(str).isin([ida, idb])
-    ]
+    ab_lines = ab_lines[ab_lines['Receipt No'].isin(target_receipts)]
     
     # Aggregate by receipt
     price_qty = (ab_lines.groupby('Receipt No')['Line Total']
@@ -85,32 +98,101 @@ def estimate_elasticity(price_qty_df: pd.DataFrame) -> dict:
     """
     Estimate constant-elasticity via log–log regression:
       log_Q = intercept + ε * log_P
+    Simple OLS in closed form (one regressor, a handful of points).
     Returns dict with epsilon, intercept, r2, n_points.
     """
-    df = price_qty_df[(price_qty_df['Combined_Price'] > 0) &
-                      (price_qty_df['Num_Transactions'] > 0)].copy()
+    # Sparse bundles (most of the tail) return before any array work
+    if len(price_qty_df) < 2:
+        n = int(((price_qty_df['Combined_Price'] > 0) & (price_qty_df['Num_Transactions'] > 0)).sum())
+        return {'epsilon': 0.0, 'intercept': 0.0, 'r2': float('nan'), 'n_points': n}
+    
+    price = price_qty_df['Combined_Price'].to_numpy(dtype=float)
+    qty = price_qty_df['Num_Transactions'].to_numpy(dtype=float)
+    keep = (price > 0) & (qty > 0)
     
-    n = len(df)
+    n = int(keep.sum())
     if n < 2:
         return {'epsilon': 0.0, 'intercept': 0.0, 'r2': float('nan'), 'n_points': n}
     
-    X = np.log(df['Combined_Price'].to_numpy()).reshape(-1, 1)
-    y = np.log(df['Num_Transactions'].to_numpy())
+    x = np.log(price[keep])
+    y = np.log(qty[keep])
     
-    reg = LinearRegression().fit(X, y)
-    y_hat = reg.predict(X)
+    xc = x - x.mean()
+    yc = y - y.mean()
+    epsilon = (xc @ yc) / (xc @ xc)
+    intercept = y.mean() - epsilon * x.mean()
+    
+    ss_res = float(((y - (intercept + epsilon * x)) ** 2).sum())
+    ss_tot = float(yc @ yc)
+    # Same convention as sklearn's r2_score when y is constant
+    if ss_tot == 0:
+        r2 = 1.0 if ss_res == 0 else 0.0
+    else:
+        r2 = 1.0 - ss_res / ss_tot
     
     return {
-        'epsilon': float(reg.coef_[0]),
-        'intercept': float(reg.intercept_),
-        'r2': float(r2_score(y, y_hat)),
+        'epsilon': float(epsilon),
+        'intercept': float(intercept),
+        'r2': r2,
         'n_points': n
     }
 
+# =========================
+# Bundles loop
+# =========================
+def process_bundle(ctx: dict, i: int, rule: dict) -> dict | None:
+    """
+    Estimate one bundle's elasticity with the per-run inputs in ctx. Returns
+    its result row, or None when the bundle is skipped.
+    """
+    id_a, id_b = resolve_ids_by_exact_names(rule, ctx['id_by_name'])
+    
+    if not id_a or not id_b:
+        print(f"[SKIP] Row {i}: cannot resolve product IDs from names.")
+        return None
+    
+    name_a = safe_name(ctx['name_by_id'], id_a)
+    name_b = safe_name(ctx['name_by_id'], id_b)
+    bundle_label = f"{name_a} + {name_b}"
+    
+    # Get bundle metadata
+    bundle_id = rule.get('bundle_id', "")
+    category = rule.get('category', "")
+    
+    # Build price-quantity points
+    price_qty = build_price_qty_points(ctx['fact_df'], ctx['fact_index'], id_a, id_b, strict=STRICT_BUNDLE_ONLY)
+    
+    # Estimate elasticity
+    est = estimate_elasticity(price_qty)
+    eps, intercept, r2, npts = est['epsilon'], est['intercept'], est['r2'], est['n_points']
+    
+    r2_display = f"{r2:.4f}" if not math.isnan(r2) else "NA"
+    print(f"[{i:02d}] ε={eps:.3f} | intercept={intercept:.3f} | R²={r2_display} | points={npts} | {bundle_label}")
+    
+    return {
+        'bundle_id': bundle_id,
+        'category': category,
+        'rule_row': i,
+        'product_id_1': id_a,
+        'product_id_2': id_b,
+        'product_name_1': name_a,
+        'product_name_2': name_b,
+        'mode': "strict" if STRICT_BUNDLE_ONLY else "non_strict",
+        'n_price_points': npts,
+        'elasticity_epsilon': None if math.isnan(eps) else round(float(eps), 6),
+        'intercept_logk': None if math.isnan(intercept) else round(float(intercept), 6),
+        'r2_logspace': None if math.isnan(r2) else round(float(r2), 6)
+    }
+
 # =========================
 # Main
 # =========================
-def main():
+def main(fact_df: pd.DataFrame | None = None, product_df: pd.DataFrame | None = None):
+    """
+    fact_df / product_df: fact_transaction_dimension (FACT_COLUMNS) and
+    current_product_dimension as exported, when the caller (run_all) already
+    has them; loaded here otherwise. They are never modified in place.
+    """
     # Import loader
     from . import loader
     import time
@@ -119,16 +201,18 @@ def main():
     print("Loading data from PostgreSQL...")
     try:
         rules_df   = loader.export_table_to_csv('association_rules')
-        fact_df    = loader.export_table_to_csv('fact_transaction_dimension')
-        product_df = loader.export_table_to_csv('current_product_dimension')
+        if fact_df is None:
+            fact_df = loader.export_table_to_csv('fact_transaction_dimension', FACT_COLUMNS)
+        if product_df is None:
+            product_df = loader.export_table_to_csv('current_product_dimension')
     except Exception as e:
         print(f"Error loading data: {e}")
         sys.exit(1)
     
     # Normalize column names (handle both snake_case and original)
     rules_df.columns = [c.lower() for c in rules_df.columns]
-    fact_df.columns = [c.title().replace('_', ' ') for c in fact_df.columns]  # Convert to Title Case for compatibility
-    product_df.columns = [c.lower() for c in product_df.columns]
+    fact_df = fact_df.rename(columns=lambda c: c.title().replace('_', ' '))  # Convert to Title Case for compatibility
+    product_df = product_df.rename(columns=str.lower)
     
     # Validate columns
     require_columns(rules_df,   ['antecedents_names', 'consequents_names'], 'RULES table')
@@ -138,6 +222,20 @@ def main():
     # Rename for compatibility with existing code
     fact_df = fact_df.rename(columns={'Product Id': 'Product ID', 'Price': 'price'})
     product_df = product_df.rename(columns={'price': 'Price'})
+
+    # The helpers below match product ids as strings; cast once up front
+    # instead of on every rule.
+    fact_df['Product ID'] = fact_df['Product ID'].astype(str)
+    product_df['product_id'] = product_df['product_id'].astype(str)
+
+    # First match wins in both directions, as with the old first-row lookups.
+    first_by_name = product_df.drop_duplicates('product_name')
+    id_by_name = dict(zip(first_by_name['product_name'], first_by_name['product_id']))
+    first_by_id = product_df.drop_duplicates('product_id')
+    name_by_id = dict(zip(first_by_id['product_id'], first_by_id['product_name']))
+
+    # Index the fact lines once instead of scanning the table per bundle
+    fact_index = index_fact_lines(fact_df)
     
     mode = "STRICT {A,B} only" if STRICT_BUNDLE_ONLY else "Receipts containing A and B (may include others)"
     print(f"=== PED Summary for TOP {min(TOP_N, len(rules_df))} bundles ===")
@@ -147,46 +245,16 @@ def main():
     rows = []
     n = min(TOP_N, len(rules_df))
     
-    for i in range(n):
-        rule = rules_df.iloc[i]
-        id_a, id_b = resolve_ids_by_exact_names(rule, product_df)
-        
-        if not id_a or not id_b:
-            print(f"[SKIP] Row {i}: cannot resolve product IDs from names.")
-            continue
-        
-        name_a = safe_name(product_df, id_a)
-        name_b = safe_name(product_df, id_b)
-        bundle_label = f"{name_a} + {name_b}"
-        
-        # Get bundle metadata
-        bundle_id = rule.get('bundle_id', "")
-        category = rule.get('category', "")
-        
-        # Build price-quantity points
-        price_qty = build_price_qty_points(fact_df, id_a, id_b, strict=STRICT_BUNDLE_ONLY)
-        
-        # Estimate elasticity
-        est = estimate_elasticity(price_qty)
-        eps, intercept, r2, npts = est['epsilon'], est['intercept'], est['r2'], est['n_points']
-        
-        r2_display = f"{r2:.4f}" if not math.isnan(r2) else "NA"
-        print(f"[{i:02d}] ε={eps:.3f} | intercept={intercept:.3f} | R²={r2_display} | points={npts} | {bundle_label}")
-        
-        rows.append({
-            'bundle_id': bundle_id,
-            'category': category,
-            'rule_row': i,
-            'product_id_1': id_a,
-            'product_id_2': id_b,
-            'product_name_1': name_a,
-            'product_name_2': name_b,
-            'mode': "strict" if STRICT_BUNDLE_ONLY else "non_strict",
-            'n_price_points': npts,
-            'elasticity_epsilon': None if math.isnan(eps) else round(float(eps), 6),
-            'intercept_logk': None if math.isnan(intercept) else round(float(intercept), 6),
-            'r2_logspace': None if math.isnan(r2) else round(float(r2), 6)
-        })
+    ctx = {
+        'fact_df': fact_df,
+        'fact_index': fact_index,
+        'id_by_name': id_by_name,
+        'name_by_id': name_by_id,
+    }
+    for i, rule in enumerate(rules_df.head(n).to_dict('records')):
+        row = process_bundle(ctx, i, rule)
+        if row is not None:
+            rows.append(row)
     
     if not rows:
         print("No bundles processed. Nothing to write.")
@@ -198,7 +266,7 @@ def main():
     
     # Upload to MinIO staging and PostgreSQL
     print("\nUploading results to MinIO and PostgreSQL...")
-    csv_bytes = result_df.to_csv(index=False).encode('utf-8')
+    csv_bytes = loader.dataframe_to_csv_bytes(result_df)
     
     # Upload to MinIO
     run_id = time.strftime("%Y%m%d_%H%M%S")
@@ -13,6 +13,18 @@ from . import mba
 from . import ped
 from . import nlp
 from . import holtwinters
+from . import loader
+
+def _load_shared_inputs() -> dict:
+    """
+    Tables read by several analysis steps and not written by any of them.
+    Loaded once per run (after ETL) and handed to each step's main().
+    """
+    fact_columns = list(dict.fromkeys(ped.FACT_COLUMNS + holtwinters.FACT_COLUMNS))
+    return {
+        'fact_df': loader.export_table_to_csv('fact_transaction_dimension', fact_columns),
+        'product_df': loader.export_table_to_csv('current_product_dimension'),
+    }
 
 def execute_pipeline():
     """
@@ -24,13 +36,20 @@ def execute_pipeline():
     5. Holt-Winters (Forecasting)
     """
     logger = logging.getLogger(__name__)
+
+    shared = {}
+
+    def shared_inputs() -> dict:
+        if not shared:
+            shared.update(_load_shared_inputs())
+        return shared
     
     pipeline_steps = [
         ("ETL", etl.main),
         ("MBA", mba.main),
-        ("PED", ped.main),
-        ("NLP", nlp.main),
-        ("Holt-Winters", holtwinters.main),
+        ("PED", lambda: ped.main(**shared_inputs())),
+        ("NLP", lambda: nlp.main(product_df=shared_inputs()['product_df'])),
+        ("Holt-Winters", lambda: holtwinters.main(**shared_inputs())),
     ]
 
     total_start_time = time.time()
@@ -39,20 +58,20 @@ def execute_pipeline():
     try:
         for i, (name, func) in enumerate(pipeline_steps):
             step_start_time = time.time()
-            logger.info(f"--- Step {i+1}/{len(pipeline_steps)}: Running {name}... ---")
+            logger.info("--- Step %d/%d: Running %s... ---", i + 1, len(pipeline_steps), name)
             
             func() # Execute the main function of the script
             
             step_duration = time.time() - step_start_time
-            logger.info(f"--- Step {i+1}/{len(pipeline_steps)}: {name} completed in {step_duration:.2f} seconds. ---")
+            logger.info("--- Step %d/%d: %s completed in %.2f seconds. ---", i + 1, len(pipeline_steps), name, step_duration)
 
         total_duration = time.time() - total_start_time
-        logger.info(f"--- Full data pipeline completed successfully in {total_duration:.2f} seconds. ---")
+        logger.info("--- Full data pipeline completed successfully in %.2f seconds. ---", total_duration)
         
     except Exception as e:
         # If any step in the pipeline fails, log the error and re-raise the exception.
         # This ensures the failure is recorded and can be handled by the calling service (the observer).
-        logger.error(f"--- Error during pipeline execution at step '{name}': {e} ---")
+        logger.error("--- Error during pipeline execution at step '%s': %s ---", name, e)
         import traceback
         traceback.print_exc()
         raise e
\ No newline at end of file
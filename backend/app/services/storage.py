@@ -3,38 +3,81 @@ MinIO storage service for uploading files and creating markers.
 """
 import io
 import logging
+import urllib3
 from minio import Minio
 from minio.error import S3Error
 from fastapi import UploadFile
+from fastapi.concurrency import run_in_threadpool
 from app.core.config import settings
 
 # Setup logging
 log = logging.getLogger(__name__)
 
 # Initialize MinIO client
+# A single shared client whose connection pool is large enough for the
+# concurrent uploads issued by the upload endpoint.
 minio_client = Minio(
     settings.minio_endpoint,
     access_key=settings.minio_access,
     secret_key=settings.minio_secret,
-    secure=settings.minio_secure
+    secure=settings.minio_secure,
+    http_client=urllib3.PoolManager(
+        timeout=urllib3.Timeout(connect=300, read=300),
+        maxsize=32,
+        block=False,
+        retries=urllib3.Retry(
+            total=5,
+            backoff_factor=0.2,
+            status_forcelist=[500, 502, 503, 504]
+        )
+    )
 )
 
+# Multipart chunk size used when streaming uploads of unknown length.
+UPLOAD_PART_SIZE = 16 * 1024 * 1024
+
+# Buckets already confirmed to exist by this process.
+_known_buckets = set()
+
 
 def ensure_bucket_exists(bucket_name: str):
     """
     Ensures the specified MinIO bucket exists. Creates it if it doesn't.
     """
+    if bucket_name in _known_buckets:
+        return
     try:
         if not minio_client.bucket_exists(bucket_name):
             minio_client.make_bucket(bucket_name)
             log.info(f"Created MinIO bucket: {bucket_name}")
         else:
             log.debug(f"MinIO bucket '{bucket_name}' already exists.")
+        _known_buckets.add(bucket_name)
     except S3Error as e:
+        # Concurrent uploads may race to create the bucket on first use.
+        if e.code in ("BucketAlreadyOwnedByYou", "BucketAlreadyExists"):
+            _known_buckets.add(bucket_name)
+            return
         log.error(f"Error ensuring bucket exists: {e}")
         raise
 
 
+def _put_stream_to_minio(file: UploadFile, object_name: str) -> None:
+    """
+    Streams the spooled upload body straight into MinIO using a multipart
+    upload, so the payload is never fully buffered in memory.
+    """
+    file.file.seek(0)
+    minio_client.put_object(
+        bucket_name=settings.minio_landing_bucket,
+        object_name=object_name,
+        data=file.file,
+        length=-1,
+        part_size=UPLOAD_PART_SIZE,
+        content_type=file.content_type or "application/octet-stream"
+    )
+
+
 async def upload_file_to_minio(
     file: UploadFile, 
     filename: str, 
@@ -42,6 +85,7 @@ async def upload_file_to_minio(
 ) -> int:
     """
     Uploads a file to MinIO in the specified folder within the landing bucket.
+    The blocking MinIO call runs in the threadpool so the event loop stays free.
     
     Args:
         file: FastAPI UploadFile object
@@ -56,23 +100,14 @@ async def upload_file_to_minio(
     """
     try:
         # Ensure the landing bucket exists
-        ensure_bucket_exists(settings.minio_landing_bucket)
-        
-        # Read file content
-        contents = await file.read()
-        file_size = len(contents)
+        await run_in_threadpool(ensure_bucket_exists, settings.minio_landing_bucket)
         
         # Create object path (folder/filename)
         object_name = f"{folder}/{filename}"
         
-        # Upload to MinIO
-        minio_client.put_object(
-            bucket_name=settings.minio_landing_bucket,
-            object_name=object_name,
-            data=io.BytesIO(contents),
-            length=file_size,
-            content_type=file.content_type or "application/octet-stream"
-        )
+        # Stream to MinIO
+        await run_in_threadpool(_put_stream_to_minio, file, object_name)
+        file_size = file.size or 0
         
         log.info(f"Uploaded {filename} to MinIO: {settings.minio_landing_bucket}/{object_name}")
         return file_size
@@ -92,13 +127,14 @@ async def create_complete_marker():
     """
     try:
         # Ensure the landing bucket exists
-        ensure_bucket_exists(settings.minio_landing_bucket)
+        await run_in_threadpool(ensure_bucket_exists, settings.minio_landing_bucket)
         
         # Create marker file
         marker_content = b"complete"
         marker_name = "_complete"
         
-        minio_client.put_object(
+        await run_in_threadpool(
+            minio_client.put_object,
             bucket_name=settings.minio_landing_bucket,
             object_name=marker_name,
             data=io.BytesIO(marker_content),
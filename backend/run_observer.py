@@ -5,10 +5,18 @@ When the trigger file is detected, it initiates the data processing pipeline.
 This service is intended to run as a separate, long-running process,
 typically in its own Docker container.
 """
-import time
+import sys
+import signal
+import threading
 import logging
 import os
-from watchdog.observers import Observer
+# On Linux use inotify explicitly so a missing inotify backend fails loudly
+# instead of silently degrading to the polling observer.
+if sys.platform.startswith("linux"):
+    from watchdog.observers.inotify import InotifyObserver as Observer
+else:
+    from watchdog.observers import Observer
+from watchdog.events import FileCreatedEvent
 from app.observer.handler import PipelineEventHandler
 from app.core.config import settings
 
@@ -17,6 +25,24 @@ from app.core.config import settings
 logging.basicConfig(level=logging.INFO,
                     format='%(asctime)s - %(message)s',
                     datefmt='%Y-%m-%d %H:%M:%S')
+logger = logging.getLogger(__name__)
+
+def _exit_with_parent() -> None:
+    """
+    On Linux, ask the kernel to send SIGTERM when the parent process dies, so an
+    observer started by a supervisor does not linger, holding its inotify watch.
+    """
+    if not sys.platform.startswith("linux"):
+        return
+    import ctypes
+    PR_SET_PDEATHSIG = 1
+    parent = os.getppid()
+    libc = ctypes.CDLL(None, use_errno=True)
+    if libc.prctl(PR_SET_PDEATHSIG, signal.SIGTERM, 0, 0, 0) != 0:
+        logger.warning("Could not set parent-death signal: %s", os.strerror(ctypes.get_errno()))
+    elif os.getppid() != parent:
+        # The parent was already gone before the request took effect.
+        os.kill(os.getpid(), signal.SIGTERM)
 
 if __name__ == "__main__":
     # Retrieve the directory to watch from the application's central settings.
@@ -24,9 +50,7 @@ if __name__ == "__main__":
     
     # Defensive check: Ensure the trigger directory exists before starting.
     # This prevents the observer from crashing if the directory is missing on startup.
-    if not os.path.exists(path):
-        logging.warning(f"Trigger directory {path} not found! Creating it.")
-        os.makedirs(path)
+    os.makedirs(path, exist_ok=True)
         
     # Instantiate the event handler, which contains the logic for what to do
     # when a file event (like creation) occurs.
@@ -39,26 +63,36 @@ if __name__ == "__main__":
     # - event_handler: The object that will receive event notifications.
     # - path: The directory to monitor.
     # - recursive=False: We only care about the top-level directory, not subdirectories.
-    observer.schedule(event_handler, path, recursive=False)
+    # - event_filter: Only file creations reach the handler. With inotify this also
+    #   narrows the kernel watch to create/move events, so opens, reads, writes and
+    #   attribute changes in the directory are never queued or dispatched.
+    observer.schedule(event_handler, path, recursive=False, event_filter=[FileCreatedEvent])
     
+    # Set by SIGINT (Ctrl+C) or SIGTERM (what `docker stop` sends) to shut down.
+    stop_event = threading.Event()
+    signal.signal(signal.SIGINT, lambda *_: stop_event.set())
+    signal.signal(signal.SIGTERM, lambda *_: stop_event.set())
+    # Also shut down if the process that started us exits.
+    _exit_with_parent()
+
     # Start the observer thread. It will now run in the background.
     observer.start()
-    logging.info(f"Starting observer, watching directory: {path}")
+    logger.info("Starting observer, watching directory: %s", path)
+    # Pick up a trigger left behind before the watch existed.
+    event_handler.sweep(path)
     
     try:
-        # Keep the main thread alive. The observer is running in a background thread.
-        # This loop prevents the script from exiting immediately.
-        while True:
-            time.sleep(1)
-    except KeyboardInterrupt:
-        # Handle graceful shutdown on Ctrl+C.
-        logging.info("Observer stopping...")
-        observer.stop()
+        # Keep the main thread alive, parked until a shutdown signal arrives.
+        # The observer is running in a background thread.
+        stop_event.wait()
+        logger.info("Observer stopping...")
     except Exception as e:
         # Catch any other unexpected errors to ensure the observer is stopped.
-        logging.error(f"Observer encountered an error: {e}")
-        observer.stop()
+        logger.error("Observer encountered an error: %s", e)
+    observer.stop()
     
     # Wait for the observer thread to finish its work before exiting the script.
     observer.join()
-    logging.info("Observer shut down.")
\ No newline at end of file
+    # Then let a pipeline run that is already in progress finish.
+    event_handler.close()
+    logger.info("Observer shut down.")
\ No newline at end of file